@@ -0,0 +1,201 @@
+""" Area Effects:
+
+- circular stencils of the tiles within a radius, computed once per radius
+- find the fighters caught in an area, optionally only those in view
+- find the fighters nearest to a coordinate
+- damage every fighter in an area at once
+
+"""
+
+from functools import lru_cache
+
+import numpy as np
+
+from game_events import Dead
+
+
+@lru_cache(maxsize=None)
+def circle_stencil(radius):
+    """ Offsets (d_x, d_y) of the tiles within a radius of a centre tile
+
+    The arrays are shared between callers, so they are read-only.
+
+    """
+
+    reach = int(radius)
+    d_x, d_y = np.mgrid[-reach:reach + 1, -reach:reach + 1]
+    inside = d_x * d_x + d_y * d_y <= radius * radius
+
+    d_x = d_x[inside]
+    d_y = d_y[inside]
+    d_x.flags.writeable = False
+    d_y.flags.writeable = False
+
+    return d_x, d_y
+
+
+@lru_cache(maxsize=None)
+def distance_rings(radius):
+    """ The offsets within a radius grouped by distance, nearest first
+
+    Each ring is a pair (squared distance, offsets at that distance).
+
+    """
+
+    d_x, d_y = circle_stencil(radius)
+    distances = d_x * d_x + d_y * d_y
+
+    order = np.argsort(distances, kind="stable")
+    d_x = d_x[order].tolist()
+    d_y = d_y[order].tolist()
+    distances = distances[order].tolist()
+
+    rings = []
+    for offset, distance in zip(zip(d_x, d_y), distances):
+        if not rings or rings[-1][0] != distance:
+            rings.append((distance, []))
+        rings[-1][1].append(offset)
+
+    return tuple((distance, tuple(offsets)) for distance, offsets in rings)
+
+
+def area_tiles(game_map, x_pos, y_pos, radius, fov=None):
+    """ Coordinates (xs, ys) of the map tiles within a radius
+
+    With a field of view (a [y, x] boolean array), only the tiles in view.
+
+    """
+
+    d_x, d_y = circle_stencil(radius)
+    xs = d_x + x_pos
+    ys = d_y + y_pos
+
+    inside = ((xs >= 0) & (xs < game_map.width)
+              & (ys >= 0) & (ys < game_map.height))
+    xs = xs[inside]
+    ys = ys[inside]
+
+    if fov is not None:
+        in_view = fov[ys, xs]
+        xs = xs[in_view]
+        ys = ys[in_view]
+
+    return xs, ys
+
+
+def fighters_in_area(game_map, x_pos, y_pos, radius, fov=None):
+    """ Entity store rows of the fighters within a radius
+
+    Rows are in the order of the floor's entity list. Small areas are looked
+    up tile by tile in the entity index, so the cost grows with the area and
+    the fighters hit rather than the entities on the floor. Areas larger than
+    the floor's entity count scan the store's position columns instead.
+
+    """
+
+    store = game_map.entity_store
+
+    if len(circle_stencil(radius)[0]) > len(store):
+        mask = store.within(x_pos, y_pos, radius, "has_fighter")
+
+        if fov is not None:
+            rows = np.flatnonzero(mask)
+            mask[rows] = fov[store.y[rows], store.x[rows]]
+
+        rows = np.flatnonzero(mask)
+    else:
+        xs, ys = area_tiles(game_map, x_pos, y_pos, radius, fov)
+        rows = np.array([
+            entity._row
+            for entity in game_map.entity_index.in_cells(xs.tolist(),
+                                                         ys.tolist())
+        ], dtype=np.intp)
+        rows = rows[store.has_fighter[rows]]
+
+    return rows[np.argsort(store.sequence[rows], kind="stable")]
+
+
+def nearest_fighters(game_map,
+                     x_pos,
+                     y_pos,
+                     radius,
+                     count=1,
+                     fov=None,
+                     exclude=None):
+    """ Up to `count` fighters within a radius, nearest first
+
+    With a field of view (a [y, x] boolean array), only fighters in view.
+    `exclude` is an entity to leave out (usually the one asking). Fighters
+    at the same distance are in the order of the floor's entity list.
+
+    Small radii walk the entity index ring by ring outwards and stop at the
+    first ring that completes the count, so the cost grows with the distance
+    to the targets rather than the entities on the floor.
+
+    """
+
+    store = game_map.entity_store
+
+    if len(circle_stencil(radius)[0]) > len(store):
+        mask = store.within(x_pos, y_pos, radius, "has_fighter")
+
+        if exclude is not None and exclude._store is store:
+            mask[exclude._row] = False
+
+        rows = np.flatnonzero(mask)
+
+        if fov is not None:
+            rows = rows[fov[store.y[rows], store.x[rows]]]
+
+        d_x = store.x[rows] - x_pos
+        d_y = store.y[rows] - y_pos
+        rows = rows[np.lexsort((store.sequence[rows], d_x * d_x + d_y * d_y))]
+
+        return [store.handles[row] for row in rows[:count].tolist()]
+
+    cells = game_map.entity_index.cells
+    has_fighter = store.has_fighter
+    sequence = store.sequence
+
+    found = []
+
+    for _, offsets in distance_rings(radius):
+        ring = []
+
+        for d_x, d_y in offsets:
+            cell = cells.get((x_pos + d_x, y_pos + d_y))
+
+            if not cell or (fov is not None
+                            and not fov[y_pos + d_y, x_pos + d_x]):
+                continue
+
+            for entity in cell:
+                if entity is not exclude and has_fighter.item(entity._row):
+                    ring.append(entity)
+
+        if ring:
+            ring.sort(key=lambda entity: sequence.item(entity._row))
+            found.extend(ring)
+
+            if len(found) >= count:
+                break
+
+    return found[:count]
+
+
+def damage_fighters(store, rows, amount):
+    """ Deal damage to the fighters of some rows at once
+
+    Returns one list of events per row, as each fighter's `take_damage`
+    would.
+
+    """
+
+    store.hp[rows] -= amount
+    dead = (store.hp[rows] <= 0).tolist()
+    xps = store.xp[rows].tolist()
+
+    handles = store.handles
+
+    return [[Dead(handles[row], xp)] if is_dead else []
+            for row, is_dead, xp in zip(rows.tolist(), dead, xps)]
@@ -0,0 +1,6 @@
+""" Benchmarks:
+
+- repeatable timings of the engine's hot paths
+- run with `python -m benchmarks --help`
+
+"""
@@ -0,0 +1,239 @@
+""" Benchmark Runner:
+
+- time every case at several map sizes with a fixed seed
+- write the results as JSON
+- time the replay of recorded sessions (see replay.py)
+- compare against a stored baseline
+
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import warnings
+
+DEFAULT_SIZES = "80x43,160x86,320x172"
+
+
+def parse_sizes(sizes):
+    """ Parse "WxH,WxH" into a list of (width, height)
+
+    """
+
+    return [
+        tuple(int(side) for side in size.split("x"))
+        for size in sizes.split(",")
+    ]
+
+
+def load_cases():
+    """ Import the cases, quieting the libtcodpy deprecation warnings
+
+    """
+
+    # The engine still uses names newer tcod releases warn about on import
+    warnings.simplefilter("ignore", FutureWarning)
+    warnings.simplefilter("ignore", DeprecationWarning)
+
+    from benchmarks.cases import CASES
+
+    return CASES
+
+
+def run_replays(paths, seed, repeat):
+    """ Time the replay of every recording, once each
+
+    """
+
+    from benchmarks.cases import replay_case
+
+    results = {}
+
+    for path in paths:
+        key = f"replay[{os.path.basename(path)}]"
+
+        results[key] = time_case(replay_case(path), 1, repeat, 0, 0, seed)
+        print(f"{key:<40} {format_result(results[key])}", file=sys.stderr)
+
+    return results
+
+
+def time_case(case, number, repeat, width, height, seed):
+    """ Time a case, returning per-call statistics in seconds
+
+    """
+
+    samples = []
+
+    for _ in range(repeat):
+        run = case(width, height, seed)
+
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        samples.append((time.perf_counter() - start) / number)
+
+    return {
+        "unit": "s",
+        "median": statistics.median(samples),
+        "best": min(samples),
+        "mean": statistics.mean(samples),
+        "repeat": repeat,
+        "number": number,
+    }
+
+
+def run_benchmarks(cases, sizes, seed, repeat):
+    """ Run the selected cases at every size
+
+    """
+
+    results = {}
+
+    for width, height in sizes:
+        for name, (case, number) in cases.items():
+            key = f"{name}[{width}x{height}]"
+
+            if number is None:
+                # A measurement rather than a timing (e.g. a size in bytes)
+                results[key] = case(width, height, seed)
+            else:
+                results[key] = time_case(case, number, repeat, width, height,
+                                         seed)
+            print(f"{key:<40} {format_result(results[key])}",
+                  file=sys.stderr)
+
+    return results
+
+
+def format_result(result):
+    """ Human readable value of a result
+
+    """
+
+    if result["unit"] == "s":
+        return f"{result['median'] * 1e6:12.1f} us"
+
+    return f"{result['value']:12} {result['unit']}"
+
+
+def result_value(result):
+    """ The number compared against the baseline
+
+    """
+
+    return result["median"] if result["unit"] == "s" else result["value"]
+
+
+def compare(results, baseline, threshold):
+    """ Print current vs baseline, returning the keys that regressed
+
+    """
+
+    regressions = []
+
+    print(f"{'benchmark':<40} {'baseline':>14} {'current':>14} {'ratio':>7}")
+
+    for key, result in results.items():
+        if key not in baseline:
+            print(f"{key:<40} {'-':>14} {format_result(result):>14}")
+            continue
+
+        old_value = result_value(baseline[key])
+        ratio = result_value(result) / old_value if old_value else 1.0
+        flag = ""
+
+        if ratio > 1 + threshold:
+            flag = " REGRESSION"
+            regressions.append(key)
+        elif ratio < 1 - threshold:
+            flag = " faster"
+
+        print(f"{key:<40} {format_result(baseline[key]):>14} "
+              f"{format_result(result):>14} {ratio:7.2f}{flag}")
+
+    return regressions
+
+
+def main(argv=None):
+    """ Command line entry point
+
+    """
+
+    cases = load_cases()
+
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Time the engine's hot paths.")
+    parser.add_argument("cases",
+                        nargs="*",
+                        metavar="case",
+                        help="cases to run (default: all): " +
+                        ", ".join(sorted(cases)))
+    parser.add_argument("--sizes",
+                        default=DEFAULT_SIZES,
+                        help=f"map sizes as WxH,... (default: {DEFAULT_SIZES})")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat",
+                        type=int,
+                        default=5,
+                        help="samples per case, the median is reported")
+    parser.add_argument("--replay",
+                        metavar="RECORDING",
+                        action="append",
+                        default=[],
+                        help="also time replaying a recorded session "
+                        "(only these, unless cases are named)")
+    parser.add_argument("--output", help="write the results to a JSON file")
+    parser.add_argument("--baseline",
+                        help="compare against a results file from --output")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.10,
+        help="relative slowdown reported as a regression (default: 0.10)")
+    args = parser.parse_args(argv)
+
+    unknown = [name for name in args.cases if name not in cases]
+    if unknown:
+        parser.error(f"unknown case(s): {', '.join(unknown)} "
+                     f"(choose from {', '.join(sorted(cases))})")
+
+    if args.cases or args.replay:
+        cases = {name: cases[name] for name in args.cases}
+
+    results = run_benchmarks(cases, parse_sizes(args.sizes), args.seed,
+                             args.repeat)
+    results.update(run_replays(args.replay, args.seed, args.repeat))
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)["results"]
+
+        if compare(results, baseline, args.threshold):
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
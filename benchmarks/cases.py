@@ -0,0 +1,547 @@
+""" Benchmark Cases:
+
+- fixtures: seeded games of a given map size
+- cases: one function per hot path, returning the callable to time
+
+"""
+
+import atexit
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+import tcod
+
+from entity import Entity
+from fov_functions import initialize_fov, recompute_fov
+from game_messages import Message, MessageLog
+from game_states import GameStates
+from item_functions import cast_fireball, cast_lightning
+from loader_functions.data_loaders import SAVE_FILE, load_game, save_game
+from loader_functions.initialize_new_game import (get_constants,
+                                                  get_game_variables)
+from map_objects.entity_store import DATA_COLUMNS
+from map_objects.game_map import GameMap, generate_floor
+from render_functions import render_all
+from replay import Recording, replay
+from simulation import Simulation
+
+# The default map the rest of the constants are tuned for
+DEFAULT_AREA = 80 * 43
+
+# Calls per sample of take_stairs, each onto a floor built beforehand
+TAKE_STAIRS_CALLS = 5
+
+
+def get_benchmark_constants(width, height):
+    """ Game constants for a map size, with room count scaled to its area
+
+    """
+
+    constants = get_constants()
+
+    scale = max(1, (width * height) // DEFAULT_AREA)
+
+    constants["map_width"] = width
+    constants["map_height"] = height
+    constants["screen_width"] = width
+    constants["screen_height"] = height + constants["panel_height"]
+    constants["panel_y"] = height
+    constants["max_rooms"] *= scale
+
+    return constants
+
+
+def new_simulation(width, height, seed):
+    """ A new game on a freshly generated floor, always the same for a seed
+
+    """
+
+    random.seed(seed)
+
+    constants = get_benchmark_constants(width, height)
+    player, entities, game_map, message_log, _ = get_game_variables(constants)
+
+    simulation = Simulation(player, entities, game_map, message_log,
+                            constants)
+    simulation.update_fov()
+
+    return simulation
+
+
+def bench_make_map(width, height, seed, generator="rooms"):
+    """ Generate a whole floor: tiles, rooms, tunnels and entities
+
+    """
+
+    constants = get_benchmark_constants(width, height)
+
+    def run():
+        random.seed(seed)
+
+        player = Entity(0, 0, '@', tcod.white, 'Player', blocks=True)
+        game_map = GameMap(width, height)
+        game_map.make_map(
+            constants["max_rooms"],
+            constants["room_min_size"],
+            constants["room_max_size"],
+            width,
+            height,
+            player,
+            [player],
+            constants["max_monsters_per_room"],
+            constants["max_items_per_room"],
+            generator=generator,
+        )
+
+    return run
+
+
+def bench_make_map_bsp(width, height, seed):
+    """ Generate a whole floor of BSP rooms
+
+    """
+
+    return bench_make_map(width, height, seed, "bsp")
+
+
+def bench_make_map_caves(width, height, seed):
+    """ Generate a whole floor of caves
+
+    """
+
+    return bench_make_map(width, height, seed, "caves")
+
+
+def bench_take_stairs(width, height, seed):
+    """ Swap in a floor built ahead of time (the part left on the stairs)
+
+    """
+
+    simulation = new_simulation(width, height, seed)
+
+    # Floors are left behind once taken, so every call takes a fresh one
+    floors = [
+        generate_floor(2, simulation.constants, seed)
+        for _ in range(TAKE_STAIRS_CALLS)
+    ]
+
+    return lambda: simulation.game_map.next_floor(
+        simulation.player, simulation.message_log, floors.pop())
+
+
+def bench_initialize_fov(width, height, seed):
+    """ Build the FOV map of a floor
+
+    """
+
+    game_map = new_simulation(width, height, seed).game_map
+
+    return lambda: initialize_fov(game_map)
+
+
+def bench_recompute_fov(width, height, seed):
+    """ Recompute the player's field of view
+
+    """
+
+    simulation = new_simulation(width, height, seed)
+    player = simulation.player
+    constants = simulation.constants
+
+    return lambda: recompute_fov(
+        simulation.fov_map,
+        player.x_pos,
+        player.y_pos,
+        constants["fov_radius"],
+        constants["fov_light_walls"],
+        constants["fov_algorithm"],
+    )
+
+
+def bench_recompute_fov_cached(width, height, seed):
+    """ Recompute the player's field of view from a spot seen before
+
+    """
+
+    simulation = new_simulation(width, height, seed)
+    player = simulation.player
+    constants = simulation.constants
+
+    return lambda: recompute_fov(
+        simulation.fov_map,
+        player.x_pos,
+        player.y_pos,
+        constants["fov_radius"],
+        constants["fov_light_walls"],
+        constants["fov_algorithm"],
+        simulation.game_map.fov_cache,
+    )
+
+
+def bench_move_astar(width, height, seed):
+    """ One A* step of the monster closest to the player
+
+    """
+
+    simulation = new_simulation(width, height, seed)
+    player = simulation.player
+
+    monster = min((entity for entity in simulation.entities if entity.ai),
+                  key=player.distance_to)
+    start = (monster.x_pos, monster.y_pos)
+
+    def run():
+        monster.move_astar(player, simulation.entities, simulation.game_map)
+        monster.place(*start)
+
+    return run
+
+
+def bench_enemy_turn(width, height, seed):
+    """ A full enemy turn, with every monster on the floor awake
+
+    """
+
+    simulation = new_simulation(width, height, seed)
+
+    # Let every monster see the player, so all of them are awake and act
+    simulation.fov_map.fov[...] = True
+    simulation.active_monsters.wake_visible(simulation.fov_map,
+                                            simulation.game_map.entity_store)
+
+    def run():
+        simulation.game_state = GameStates.ENEMY_TURN
+        simulation.take_enemy_turn()
+
+    return run
+
+
+def crowd_player(simulation, reach):
+    """ Move the floor's monsters around the player, as many as fit
+
+    """
+
+    player = simulation.player
+
+    monsters = [entity for entity in simulation.entities if entity.ai]
+    offsets = [(d_x, d_y) for d_x in range(-reach, reach + 1)
+               for d_y in range(-reach, reach + 1) if d_x or d_y]
+
+    for monster, (d_x, d_y) in zip(monsters, offsets):
+        monster.place(player.x_pos + d_x, player.y_pos + d_y)
+
+
+def bench_fireball(width, height, seed):
+    """ A fireball bursting on the player, in a room packed with monsters
+
+    """
+
+    simulation = new_simulation(width, height, seed)
+    player = simulation.player
+    crowd_player(simulation, 4)
+
+    # Harmless, so every call burns the same crowd
+    return lambda: cast_fireball(
+        player,
+        entities=simulation.entities,
+        fov_map=simulation.fov_map,
+        game_map=simulation.game_map,
+        damage=0,
+        radius=4,
+        target_x_pos=player.x_pos,
+        target_y_pos=player.y_pos,
+    )
+
+
+def bench_lightning(width, height, seed):
+    """ A lightning bolt from the player, with monsters all around
+
+    """
+
+    simulation = new_simulation(width, height, seed)
+    player = simulation.player
+    crowd_player(simulation, 4)
+
+    return lambda: cast_lightning(
+        player,
+        entities=simulation.entities,
+        fov_map=simulation.fov_map,
+        game_map=simulation.game_map,
+        damage=0,
+        maximum_range=5,
+    )
+
+
+def bench_render(width, height, seed, fov_recompute):
+    """ Draw a frame to off-screen consoles
+
+    """
+
+    simulation = new_simulation(width, height, seed)
+    constants = simulation.constants
+
+    console = tcod.console.Console(constants["screen_width"],
+                                   constants["screen_height"])
+    panel = tcod.console.Console(constants["screen_width"],
+                                 constants["panel_height"])
+    mouse = tcod.Mouse()
+
+    def run():
+        render_all(
+            console,
+            panel,
+            simulation.entities,
+            simulation.player,
+            simulation.game_map,
+            simulation.fov_map,
+            fov_recompute,
+            simulation.message_log,
+            constants["screen_width"],
+            constants["screen_height"],
+            constants["bar_width"],
+            constants["panel_height"],
+            constants["panel_y"],
+            mouse,
+            constants["colors"],
+            simulation.game_state,
+        )
+
+    return run
+
+
+def bench_render_fov(width, height, seed):
+    """ Draw a frame, redrawing every map tile
+
+    """
+
+    return bench_render(width, height, seed, True)
+
+
+def bench_render_idle(width, height, seed):
+    """ Draw a frame where nothing changed
+
+    """
+
+    return bench_render(width, height, seed, False)
+
+
+def bench_add_message(width, height, seed):
+    """ Add a message long enough to wrap onto several lines
+
+    """
+
+    constants = get_benchmark_constants(width, height)
+    message_log = MessageLog(constants["message_x"],
+                             constants["message_width"],
+                             constants["message_height"])
+    message = Message(
+        "The Troll attacks Player for 4 hit points, and the Orc attacks "
+        "Player for 3 hit points while the fireball burns everything "
+        "within 3 tiles!", tcod.orange)
+
+    return lambda: message_log.add_message(message)
+
+
+def temporary_directory():
+    """ A throwaway directory, removed at exit
+
+    """
+
+    directory = tempfile.mkdtemp(prefix="py-rl-bench-")
+    atexit.register(shutil.rmtree, directory, True)
+
+    return directory
+
+
+def in_directory(directory, func):
+    """ Wrap a save/load callable to run with a working directory
+
+    """
+
+    def run():
+        cwd = os.getcwd()
+        os.chdir(directory)
+        try:
+            return func()
+        finally:
+            os.chdir(cwd)
+
+    return run
+
+
+def save_simulation(simulation):
+    """ Save a simulation's game state in the working directory
+
+    """
+
+    save_game(simulation.player, simulation.entities, simulation.game_map,
+              simulation.message_log, simulation.game_state)
+
+
+def bench_save_game(width, height, seed):
+    """ Save the whole game state
+
+    """
+
+    simulation = new_simulation(width, height, seed)
+
+    return in_directory(temporary_directory(),
+                        lambda: save_simulation(simulation))
+
+
+def bench_load_game(width, height, seed):
+    """ Load the whole game state
+
+    """
+
+    simulation = new_simulation(width, height, seed)
+    directory = temporary_directory()
+
+    in_directory(directory, lambda: save_simulation(simulation))()
+
+    return in_directory(directory, load_game)
+
+
+def measure_save_size(width, height, seed):
+    """ Size of the save file, in bytes
+
+    """
+
+    simulation = new_simulation(width, height, seed)
+    directory = temporary_directory()
+
+    in_directory(directory, lambda: save_simulation(simulation))()
+
+    return {
+        "unit": "bytes",
+        "value": os.path.getsize(os.path.join(directory, SAVE_FILE)),
+    }
+
+
+# Components an entity owns, each counted along with it
+COMPONENTS = ("fighter", "ai", "item", "inventory", "stairs", "level")
+
+
+def entity_parts(entity):
+    """ An entity's handle followed by its components
+
+    """
+
+    return [entity] + [
+        getattr(entity, name) for name in COMPONENTS if getattr(entity, name)
+    ]
+
+
+def store_row_size(store):
+    """ Bytes of one row of an entity store, over all its columns
+
+    """
+
+    columns = [store.alive, store.sequence]
+    columns += [getattr(store, name) for name in DATA_COLUMNS]
+
+    return sum(column[:1].nbytes for column in columns)
+
+
+def attribute_names(part):
+    """ Attributes an entity part would hold in a `__dict__` without slots
+
+    What the slots keep in the store or under another name comes from its
+    pickled state; every part also links back to its entity or floor.
+
+    """
+
+    if "__getstate__" in vars(type(part)):
+        names = set(part.__getstate__())
+    else:
+        names = set()
+    names.update(name for name in part.__slots__ if not name.startswith("_"))
+    names.add("game_map" if isinstance(part, Entity) else "owner")
+
+    return names
+
+
+class DictBased:
+    """ A plain object, to size the instance of a class without slots
+
+    """
+
+
+def measure_entity_memory(width, height, seed, dict_based=False):
+    """ Memory held by each entity of a floor with its components, in bytes
+
+    Counted with sys.getsizeof, so it is the same on every run: the slotted
+    handle, its components and its row of the entity store. Contents shared
+    with the rest of the game (names, colors, the floor) are not counted.
+
+    With `dict_based`, each part is counted as a plain object holding its
+    attributes in a `__dict__` instead, as the entities were before slots
+    and the entity store.
+
+    """
+
+    simulation = new_simulation(width, height, seed)
+    entities = simulation.entities
+
+    if dict_based:
+        instance_size = sys.getsizeof(DictBased())
+        size = sum(
+            instance_size + sys.getsizeof(dict.fromkeys(attribute_names(part)))
+            for entity in entities for part in entity_parts(entity))
+    else:
+        size = sum(
+            sys.getsizeof(part)
+            for entity in entities for part in entity_parts(entity))
+        size += len(entities) * store_row_size(
+            simulation.game_map.entity_store)
+
+    return {"unit": "bytes", "value": size // len(entities)}
+
+
+def measure_entity_memory_dict(width, height, seed):
+    """ Memory the same entities would hold without slots, in bytes
+
+    """
+
+    return measure_entity_memory(width, height, seed, dict_based=True)
+
+
+def replay_case(path):
+    """ A case replaying a recorded session (map sizes do not apply)
+
+    """
+
+    recording = Recording.load(path)
+    constants = get_constants()
+
+    def case(width, height, seed):
+        return lambda: replay(recording, constants)
+
+    return case
+
+
+# name -> (case, calls per sample), or (measurement, None)
+CASES = {
+    "make_map": (bench_make_map, 1),
+    "make_map_bsp": (bench_make_map_bsp, 1),
+    "make_map_caves": (bench_make_map_caves, 1),
+    "take_stairs": (bench_take_stairs, TAKE_STAIRS_CALLS),
+    "initialize_fov": (bench_initialize_fov, 20),
+    "recompute_fov": (bench_recompute_fov, 50),
+    "recompute_fov_cached": (bench_recompute_fov_cached, 50),
+    "move_astar": (bench_move_astar, 50),
+    "enemy_turn": (bench_enemy_turn, 5),
+    "fireball": (bench_fireball, 50),
+    "lightning": (bench_lightning, 100),
+    "render_all_fov_recompute": (bench_render_fov, 5),
+    "render_all": (bench_render_idle, 50),
+    "add_message": (bench_add_message, 1000),
+    "save_game": (bench_save_game, 1),
+    "load_game": (bench_load_game, 1),
+    "save_size": (measure_save_size, None),
+    "entity_memory": (measure_entity_memory, None),
+    "entity_memory_dict": (measure_entity_memory_dict, None),
+}
@@ -4,9 +4,11 @@
 
 """
 
+import random
+
 import tcod
 
-from random import randint
+from game_events import MessageEvent
 from game_messages import Message
 
 
@@ -15,7 +17,20 @@ class BasicMonster:
 
     """
 
-    def take_turn(self, target, fov_map, game_map, entities):
+    __slots__ = ("noise", "owner")
+
+    def __init__(self):
+        # Where the last noise this monster heard came from
+        self.noise = None
+
+    def hear(self, x_pos, y_pos):
+        """ Remember a noise, to go and look for its source
+
+        """
+
+        self.noise = (x_pos, y_pos)
+
+    def take_turn(self, target, fov_map, game_map, entities, rng=random):
         """ Determines if monster moves or attacks
 
         """
@@ -23,13 +38,22 @@ class BasicMonster:
         results = []
 
         monster = self.owner
+        x_pos, y_pos = monster.position
+
+        # The fov array is indexed [y, x]
+        if fov_map.fov[y_pos, x_pos]:
+            self.noise = None
 
-        if tcod.map_is_in_fov(fov_map, monster.x_pos, monster.y_pos):
             if monster.distance_to(target) >= 2:
-                monster.move_astar(target, entities, game_map)
+                monster.move_flow(target, entities, game_map)
             elif target.fighter.hp > 0:
                 attack_results = monster.fighter.attack(target)
                 results.extend(attack_results)
+        elif self.noise:
+            if (x_pos, y_pos) == self.noise:
+                self.noise = None
+            else:
+                monster.move_towards(*self.noise, game_map, entities)
 
         return results
 
@@ -39,11 +63,20 @@ class ConfusedMonster:
 
     """
 
+    __slots__ = ("previous_ai", "number_of_turns", "owner")
+
     def __init__(self, previous_ai, number_of_turns=10):
         self.previous_ai = previous_ai
         self.number_of_turns = number_of_turns
 
-    def take_turn(self, target, fov_map, game_map, entities):
+    def hear(self, x_pos, y_pos):
+        """ A confused monster cannot follow a noise, but remembers it
+
+        """
+
+        self.previous_ai.hear(x_pos, y_pos)
+
+    def take_turn(self, target, fov_map, game_map, entities, rng=random):
         """ Takes a turn for a confused monster, randomly moving about
 
         """
@@ -51,8 +84,8 @@ class ConfusedMonster:
         results = []
 
         if self.number_of_turns > 0:
-            random_x_pos = self.owner.x_pos + randint(0, 2) - 1
-            random_y_pos = self.owner.y_pos + randint(0, 2) - 1
+            random_x_pos = self.owner.x_pos + rng.randint(0, 2) - 1
+            random_y_pos = self.owner.y_pos + rng.randint(0, 2) - 1
 
             if random_x_pos != self.owner.x_pos and random_y_pos != self.owner.y_pos:
                 self.owner.move_towards(random_x_pos, random_y_pos, game_map, entities)
@@ -60,6 +93,6 @@ class ConfusedMonster:
             self.number_of_turns -= 1
         else:
             self.owner.ai = self.previous_ai
-            results.append({'message': Message(f'The {self.owner.name} is no longer confused!', tcod.red)})
+            results.append(MessageEvent(Message(f'The {self.owner.name} is no longer confused!', tcod.red)))
 
         return results
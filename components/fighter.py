@@ -6,20 +6,92 @@
 
 import tcod
 
+from game_events import Dead, MessageEvent
 from game_messages import Message
 
 
+# Stats kept in the owner's row of the entity store
+STATS = ("max_hp", "hp", "defense", "power", "xp")
+
+
+class Stat:
+    """ A fighter stat, stored in the owning entity's row
+
+    A fighter that has no owner yet keeps its stats itself.
+
+    """
+
+    __slots__ = ("name", )
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, fighter, owner_type=None):
+        if fighter is None:
+            return self
+
+        owner = fighter._owner
+        if owner is None:
+            return fighter._stats[self.name]
+
+        return getattr(owner._store, self.name).item(owner._row)
+
+    def __set__(self, fighter, value):
+        owner = fighter._owner
+        if owner is None:
+            fighter._stats[self.name] = value
+        else:
+            getattr(owner._store, self.name)[owner._row] = value
+
+
 class Fighter:
     """ A component for Entities that holds information for combat
 
     """
 
+    __slots__ = ("_owner", "_stats")
+
+    max_hp = Stat("max_hp")
+    hp = Stat("hp")
+    defense = Stat("defense")
+    power = Stat("power")
+    xp = Stat("xp")
+
     def __init__(self, hp, defense, power, xp=0):
-        self.max_hp = hp
-        self.hp = hp
-        self.defense = defense
-        self.power = power
-        self.xp = xp
+        self._owner = None
+        self._stats = {
+            "max_hp": hp,
+            "hp": hp,
+            "defense": defense,
+            "power": power,
+            "xp": xp
+        }
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in STATS}
+
+    def __setstate__(self, state):
+        self._owner = None
+        self._stats = {name: state[name] for name in STATS}
+
+    @property
+    def owner(self):
+        return self._owner
+
+    @owner.setter
+    def owner(self, owner):
+        if self._owner is None:
+            stats = self._stats
+        else:
+            stats = {name: getattr(self, name) for name in STATS}
+
+        self._owner = owner
+        self._stats = None if owner else stats
+
+        if owner:
+            store, row = owner._store, owner._row
+            for name, value in stats.items():
+                getattr(store, name)[row] = value
 
     def take_damage(self, amount):
         """ Reduces the HP of an entity
@@ -31,7 +103,7 @@ class Fighter:
         self.hp -= amount
 
         if self.hp <= 0:
-            results.append({"dead": self.owner, 'xp': self.xp})
+            results.append(Dead(self.owner, self.xp))
 
         return results
 
@@ -55,21 +127,19 @@ class Fighter:
         damage = self.power - target.fighter.defense
 
         if damage > 0:
-            results.append({
-                "message":
-                Message(
-                    f"{self.owner.name.capitalize()} attacks {target.name} for {str(damage)} hit points",
-                    tcod.white,
-                )
-            })
+            results.append(
+                MessageEvent(
+                    Message(
+                        f"{self.owner.name.capitalize()} attacks {target.name} for {str(damage)} hit points",
+                        tcod.white,
+                    )))
             results.extend(target.fighter.take_damage(damage))
         else:
-            results.append({
-                "message":
-                Message(
-                    f"{self.owner.name.capitalize()} attacks {target.name} but does no damage.",
-                    tcod.white,
-                )
-            })
+            results.append(
+                MessageEvent(
+                    Message(
+                        f"{self.owner.name.capitalize()} attacks {target.name} but does no damage.",
+                        tcod.white,
+                    )))
 
         return results
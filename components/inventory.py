@@ -6,6 +6,8 @@
 
 import tcod
 
+from game_events import (ItemAdded, ItemConsumed, ItemDropped, MessageEvent,
+                         Targeting)
 from game_messages import Message
 
 
@@ -14,6 +16,8 @@ class Inventory:
 
     """
 
+    __slots__ = ("capacity", "items", "owner")
+
     def __init__(self, capacity):
         self.capacity = capacity
         self.items = []
@@ -27,20 +31,14 @@ class Inventory:
 
         if len(self.items) >= self.capacity:
             results.append(
-                {
-                    "item_added": None,
-                    "message": Message(
+                MessageEvent(
+                    Message(
                         "You cannot carry any more, your inventory is full", tcod.yellow
-                    ),
-                }
-            )
+                    )))
         else:
             results.append(
-                {
-                    "item_added": item,
-                    "message": Message(f"You pick up the {item.name}!", tcod.blue),
-                }
-            )
+                MessageEvent(Message(f"You pick up the {item.name}!", tcod.blue)))
+            results.append(ItemAdded(item))
             self.items.append(item)
 
         return results
@@ -54,20 +52,19 @@ class Inventory:
 
         item_component = item_entity.item
 
-        if item_component.use_function is None:
-            results.append({})
-        else:
+        if item_component.use_function is not None:
             if item_component.targeting and not (
                 kwargs.get("target_x_pos") or kwargs.get("target_y_pos")
             ):
-                results.append({"targeting": item_entity})
+                results.append(Targeting(item_entity))
             else:
                 kwargs = {**item_component.function_kwargs, **kwargs}
                 item_use_results = item_component.use_function(self.owner, **kwargs)
 
                 for item_use_result in item_use_results:
-                    if item_use_result.get("consumed"):
+                    if isinstance(item_use_result, ItemConsumed):
                         self.remove_item(item_entity)
+                        item_entity.discard()
 
                 results.extend(item_use_results)
 
@@ -92,10 +89,7 @@ class Inventory:
 
         self.remove_item(item)
         results.append(
-            {
-                "item_dropped": item,
-                "message": Message(f"You dropped the {item.name}", tcod.yellow),
-            }
-        )
+            MessageEvent(Message(f"You dropped the {item.name}", tcod.yellow)))
+        results.append(ItemDropped(item))
 
         return results
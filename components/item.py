@@ -10,6 +10,9 @@ class Item:
 
     """
 
+    __slots__ = ("use_function", "targeting", "targeting_message",
+                 "function_kwargs", "owner")
+
     def __init__(
         self, use_function=None, targeting=False, targeting_message=None, **kwargs
     ):
@@ -10,6 +10,9 @@ class Level:
 
     """
 
+    __slots__ = ("current_level", "current_xp", "level_up_base",
+                 "level_up_factor", "owner")
+
     # TODO: Move to constants...
     def __init__(self,
                  current_level=1,
@@ -10,5 +10,7 @@ class Stairs:
 
     """
 
+    __slots__ = ("floor", "owner")
+
     def __init__(self, floor):
         self.floor = floor
@@ -19,6 +19,9 @@ def kill_player(player):
     player.char = "%"
     player.color = tcod.dark_red
 
+    if player.game_map:
+        player.game_map.dirty.mark(player.x_pos, player.y_pos)
+
     return Message("You died!", tcod.red), GameStates.PLAYER_DEAD
 
 
@@ -4,297 +4,164 @@
 
 """
 
+import argparse
+from contextlib import nullcontext
+
 import tcod
 
-from death_functions import kill_monster, kill_player
-from entity import get_blocking_entities_at_location
-from fov_functions import initialize_fov, recompute_fov
+from exception_handlers import SaveFormatError
+from frame_pacer import FramePacer
+from game_events import Exit, NewFloor
 from game_messages import Message
 from game_states import GameStates
 from key_handlers import handle_keys, handle_main_menu, handle_mouse
+from loader_functions.autosave import AutoSaver
 from loader_functions.data_loaders import load_game, save_game
 from loader_functions.initialize_new_game import (get_constants,
                                                   get_game_variables)
+from map_objects.floor_prefetcher import FloorPrefetcher
 from menu import main_menu, message_box
-from render_functions import clear_all, render_all
-
-
-def play_game(player, entities, game_map, message_log, game_state, console,
-              panel, constants):
-    """ Initialize game and handle actions via game state and player events
+from phase_timer import PhaseTimer
+from random_streams import RandomStreams, new_seed
+from render_functions import (TIMINGS_HEIGHT, TIMINGS_WIDTH, render_all,
+                              render_timings)
+from replay import ActionRecorder
+from simulation import Simulation
+
+
+def play_game(player,
+              entities,
+              game_map,
+              message_log,
+              game_state,
+              console,
+              panel,
+              constants,
+              seed=None,
+              record_path=None):
+    """ Window front-end: draw the game and feed player events to it
+
+    With a `record_path`, the session is recorded there (see replay.py).
+
+    Every phase of a turn and a frame is timed. F3 shows the timings on
+    screen, and they are written to the timings file on leaving the game.
 
     """
 
-    fov_recompute = True
+    timer = PhaseTimer(path=constants["timings_file"])
 
-    fov_map = initialize_fov(game_map)
+    floor_prefetcher = FloorPrefetcher()
+    simulation = Simulation(player, entities, game_map, message_log,
+                            constants, floor_prefetcher, seed, timer)
+
+    recording = nullcontext()
+    recorder = None
+    if record_path:
+        recording = recorder = ActionRecorder(record_path, simulation)
 
     key = tcod.Key()
     mouse = tcod.Mouse()
+    pacer = FramePacer(constants["frame_rate_cap"], constants["input_timeout"],
+                       timer)
+    show_timings = False
+    timings_window = tcod.console_new(TIMINGS_WIDTH, TIMINGS_HEIGHT)
+
+    next_autosave = constants["autosave_turns"]
+
+    # The root console may still show the main menu
+    game_map.dirty.mark_all()
+
+    with floor_prefetcher, AutoSaver() as autosaver, recording, timer:
+        while not tcod.console_is_window_closed():
+            # Draw what the last input changed, then sleep until the next
+            if pacer.frame_due():
+                fov_recompute = simulation.update_fov()
+
+                with timer.phase("render"):
+                    render_all(
+                        console,
+                        panel,
+                        simulation.entities,
+                        player,
+                        game_map,
+                        simulation.fov_map,
+                        fov_recompute,
+                        message_log,
+                        constants["screen_width"],
+                        constants["screen_height"],
+                        constants["bar_width"],
+                        constants["panel_height"],
+                        constants["panel_y"],
+                        mouse,
+                        constants["colors"],
+                        simulation.game_state,
+                        timer,
+                    )
 
-    game_state = GameStates.PLAYERS_TURN
-    previous_game_state = game_state
+                if show_timings:
+                    render_timings(timings_window, timer,
+                                   constants["screen_width"], game_map.dirty)
 
-    targeting_item = None
+                with timer.phase("flush"):
+                    tcod.console_flush()
 
-    while not tcod.console_is_window_closed():
-        tcod.sys_check_for_event(tcod.EVENT_KEY_PRESS | tcod.EVENT_MOUSE, key,
-                                 mouse)
-
-        if fov_recompute:
-            recompute_fov(
-                fov_map,
-                player.x_pos,
-                player.y_pos,
-                constants["fov_radius"],
-                constants["fov_light_walls"],
-                constants["fov_algorithm"],
-            )
-
-        render_all(
-            console,
-            panel,
-            entities,
-            player,
-            game_map,
-            fov_map,
-            fov_recompute,
-            message_log,
-            constants["screen_width"],
-            constants["screen_height"],
-            constants["bar_width"],
-            constants["panel_height"],
-            constants["panel_y"],
-            mouse,
-            constants["colors"],
-            game_state,
-        )
-
-        fov_recompute = False
-
-        tcod.console_flush()
-
-        clear_all(console, entities)
-
-        action = handle_keys(key, game_state)
-        mouse_action = handle_mouse(mouse)
-
-        move = action.get("move")
-        pickup = action.get("pickup")
-        show_inventory = action.get("show_inventory")
-        drop_inventory = action.get("drop_inventory")
-        inventory_index = action.get("inventory_index")
-        take_stairs = action.get('take_stairs')
-        level_up = action.get('level_up')
-        exit_game = action.get("exit")
-        fullscreen = action.get("fullscreen")
-
-        left_click = mouse_action.get("left_click")
-        right_click = mouse_action.get("right_click")
-
-        player_turn_results = []
-
-        if move and game_state == GameStates.PLAYERS_TURN:
-            d_x, d_y = move
-            destination_x = player.x_pos + d_x
-            destination_y = player.y_pos + d_y
-
-            if not game_map.is_blocked(destination_x, destination_y):
-                target = get_blocking_entities_at_location(
-                    entities, destination_x, destination_y)
-
-                if target:
-                    attack_results = player.fighter.attack(target)
-                    player_turn_results.extend(attack_results)
-                else:
-                    player.move(d_x, d_y)
-                    fov_recompute = True
-
-                game_state = GameStates.ENEMY_TURN
-
-        elif pickup and game_state == GameStates.PLAYERS_TURN:
-            for entity in entities:
-                if (entity.item and entity.x_pos == player.x_pos
-                        and entity.y_pos == player.y_pos):
-                    pickup_results = player.inventory.add_item(entity)
-                    player_turn_results.extend(pickup_results)
-
-                    break
-            else:
-                message_log.add_message(
-                    Message("There is nothing here to pick up.", tcod.yellow))
-
-        if show_inventory:
-            previous_game_state = game_state
-            game_state = GameStates.SHOW_INVENTORY
-
-        if drop_inventory:
-            previous_game_state = game_state
-            game_state = GameStates.DROP_INVENTORY
-
-        if (inventory_index is not None
-                and previous_game_state != GameStates.PLAYER_DEAD
-                and inventory_index < len(player.inventory.items)):
-            item = player.inventory.items[inventory_index]
-
-            if game_state == GameStates.SHOW_INVENTORY:
-                player_turn_results.extend(
-                    player.inventory.use(
-                        item, entities=entities, fov_map=fov_map))
-            elif game_state == GameStates.DROP_INVENTORY:
-                player_turn_results.extend(player.inventory.drop_item(item))
-
-        if take_stairs and game_state == GameStates.PLAYERS_TURN:
-            for entity in entities:
-                if entity.stairs and (entity.x_pos == player.x_pos
-                                      and entity.y_pos == player.y_pos):
-                    entities = game_map.next_floor(player, message_log,
-                                                   constants)
-                    fov_map = initialize_fov(game_map)
-                    fov_recompute = True
+            if not pacer.wait(key, mouse):
+                continue
+
+            with timer.phase("handle_keys"):
+                action = handle_keys(key, simulation.game_state)
+                mouse_action = handle_mouse(mouse)
+
+            if action.get("fullscreen"):
+                tcod.console_set_fullscreen(not tcod.console_is_fullscreen())
+
+            if action.get("toggle_timings"):
+                show_timings = not show_timings
+                # The overlay is drawn over the map, which must be redrawn
+                # to hide it
+                game_map.dirty.mark_all()
+
+            if recorder:
+                recorder.record(action, mouse_action)
+
+            for event in simulation.step(action, mouse_action):
+                if isinstance(event, NewFloor):
                     tcod.console_clear(console)
-                    break
-            else:
-                message_log.add_message(
-                    Message('There are no stairs here.', tcod.yellow))
-
-        if level_up:
-            if level_up == 'hp':
-                player.fighter.max_hp += 20
-                player.fighter.hp += 20
-            elif level_up == 'str':
-                player.fighter.power += 1
-            elif level_up == 'def':
-                player.fighter.defense += 1
-
-            game_state = previous_game_state
-
-        if game_state == GameStates.TARGETING:
-            if left_click:
-                target_x_pos, target_y_pos = left_click
-
-                print(left_click)
-
-                item_use_results = player.inventory.use(
-                    targeting_item,
-                    entities=entities,
-                    fov_map=fov_map,
-                    target_x_pos=target_x_pos,
-                    target_y_pos=target_y_pos,
-                )
-                player_turn_results.extend(item_use_results)
-            elif right_click:
-                print(right_click)
-                player_turn_results.append({"targeting_cancelled": True})
-
-        if exit_game:
-            if game_state in (GameStates.SHOW_INVENTORY,
-                              GameStates.DROP_INVENTORY):
-                game_state = previous_game_state
-            elif game_state == GameStates.TARGETING:
-                player_turn_results.append({"targeting_cancelled": True})
-            else:
-                save_game(player, entities, game_map, message_log, game_state)
-                return True
-
-        if fullscreen:
-            tcod.console_set_fullscreen(not tcod.console_is_fullscreen())
-
-        for player_turn_result in player_turn_results:
-            message = player_turn_result.get("message")
-            dead_entity = player_turn_result.get("dead")
-            item_added = player_turn_result.get("item_added")
-            item_consumed = player_turn_result.get("consumed")
-            item_dropped = player_turn_result.get("item_dropped")
-            targeting = player_turn_result.get("targeting")
-            targeting_cancelled = player_turn_result.get("targeting_cancelled")
-            xp = player_turn_result.get("xp")
-
-            if message:
-                message_log.add_message(message)
-
-            if dead_entity:
-                if dead_entity == player:
-                    message, game_state = kill_player(dead_entity)
-                else:
-                    message = kill_monster(dead_entity)
-
-                message_log.add_message(message)
-
-            if item_added:
-                entities.remove(item_added)
-                game_state = GameStates.ENEMY_TURN
-
-            if item_consumed:
-                game_state = GameStates.ENEMY_TURN
-
-            if item_dropped:
-                entities.append(item_dropped)
-                game_state = GameStates.ENEMY_TURN
-
-            if targeting:
-                previous_game_state = GameStates.PLAYERS_TURN
-                game_state = GameStates.TARGETING
-
-                targeting_item = targeting
-
-                message_log.add_message(targeting_item.item.targeting_message)
-
-            if targeting_cancelled:
-                game_state = previous_game_state
-
-                message_log.add_message(Message("Targeting cancelled"))
-
-            if xp:
-                leveled_up = player.level.add_xp(xp)
+
+                if isinstance(event, Exit):
+                    # The final save must land after any autosave in flight
+                    autosaver.close()
+                    save_game(player, simulation.entities, game_map,
+                              message_log, simulation.game_state)
+                    return True
+
+            if simulation.turn >= next_autosave:
+                autosaver.save(player, simulation.entities, game_map,
+                               message_log, simulation.game_state)
+                next_autosave = simulation.turn + constants["autosave_turns"]
+
+            if autosaver.error:
                 message_log.add_message(
-                    Message(f'You gain {xp} experience points'))
-
-                if leveled_up:
-                    message_log.add_message(
-                        Message(
-                            f'Your battle skills grow stronger! You reached level {player.level.current_level}!',
-                            tcod.yellow))
-                    previous_game_state = game_state
-                    game_state = GameStates.LEVEL_UP
-
-        if game_state == GameStates.ENEMY_TURN:
-            for entity in entities:
-                if entity.ai:
-                    enemy_turn_results = entity.ai.take_turn(
-                        player, fov_map, game_map, entities)
-
-                    for enemy_turn_result in enemy_turn_results:
-                        message = enemy_turn_result.get("message")
-                        dead_entity = enemy_turn_result.get("dead")
-
-                        if message:
-                            message_log.add_message(message)
-
-                        if dead_entity:
-                            if dead_entity == player:
-                                message, game_state = kill_player(dead_entity)
-                            else:
-                                message = kill_monster(dead_entity)
-
-                            message_log.add_message(message)
-
-                            if game_state == GameStates.PLAYER_DEAD:
-                                break
-
-                    if game_state == GameStates.PLAYER_DEAD:
-                        break
-            else:
-                game_state = GameStates.PLAYERS_TURN
+                    Message(f"Autosave failed: {autosaver.error}", tcod.red))
+                autosaver.error = None
 
 
-def main():
+def main(argv=None):
     """ Main game loop
 
     Init console + wraps key events
 
     """
 
+    parser = argparse.ArgumentParser(prog="python engine.py")
+    parser.add_argument("--record",
+                        metavar="PATH",
+                        help="record the session, to replay with replay.py")
+    parser.add_argument("--seed",
+                        type=int,
+                        help="game seed for new games (default: random)")
+    args = parser.parse_args(argv)
+
     constants = get_constants()
 
     tcod.console_set_custom_font(
@@ -317,6 +184,7 @@ def main():
     game_map = None
     message_log = None
     game_state = None
+    seed = None
 
     show_main_menu = True
     show_load_error_message = False
@@ -325,21 +193,24 @@ def main():
 
     key = tcod.Key()
     mouse = tcod.Mouse()
+    pacer = FramePacer(constants["frame_rate_cap"], constants["input_timeout"])
 
     while not tcod.console_is_window_closed():
-        tcod.sys_check_for_event(tcod.EVENT_KEY_PRESS | tcod.EVENT_MOUSE, key,
-                                 mouse)
-
         if show_main_menu:
-            main_menu(console, main_menu_background_image,
-                      constants['screen_width'], constants['screen_height'])
+            if pacer.frame_due():
+                main_menu(console, main_menu_background_image,
+                          constants['screen_width'],
+                          constants['screen_height'])
+
+                if show_load_error_message:
+                    message_box(console, 'No save game to load', 50,
+                                constants['screen_width'],
+                                constants['screen_height'])
 
-            if show_load_error_message:
-                message_box(console, 'No save game to load', 50,
-                            constants['screen_width'],
-                            constants['screen_height'])
+                tcod.console_flush()
 
-            tcod.console_flush()
+            if not pacer.wait(key, mouse):
+                continue
 
             action = handle_main_menu(key)
 
@@ -351,24 +222,28 @@ def main():
                                             or exit_game):
                 show_load_error_message = False
             elif new_game:
+                seed = new_seed() if args.seed is None else args.seed
                 player, entities, game_map, message_log, game_state = get_game_variables(
-                    constants)
+                    constants,
+                    RandomStreams(seed).map)
                 game_state = GameStates.PLAYERS_TURN
                 show_main_menu = False
             elif load_saved_game:
                 try:
                     player, entities, game_map, message_log, game_state = load_game(
                     )
+                    seed = None
                     show_main_menu = False
-                except FileNotFoundError:
+                except (FileNotFoundError, SaveFormatError):
                     show_load_error_message = True
             elif exit_game:
                 break
         else:
             tcod.console_clear(console)
             play_game(player, entities, game_map, message_log, game_state,
-                      console, panel, constants)
+                      console, panel, constants, seed, args.record)
             show_main_menu = True
+            pacer.changed()
 
 
 if __name__ == "__main__":
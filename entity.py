@@ -11,14 +11,26 @@ from math import sqrt
 
 import tcod
 
+from map_objects.entity_store import UNPLACED
 from render_functions import RenderOrder
 
 
+# Render orders by value, to turn the stored value back into the enum
+RENDER_ORDERS = {render_order.value: render_order for render_order in RenderOrder}
+
+
 class Entity:
     """ A generic object to represent layers, enemies, items, etc.
 
+    The entity's position, glyph, render order and fighter stats live in a
+    row of an EntityStore (its floor's, or UNPLACED while off any floor), and
+    the entity is a handle onto that row.
+
     """
 
+    __slots__ = ("_store", "_row", "_color", "name", "_fighter", "_ai",
+                 "item", "inventory", "_stairs", "level", "game_map")
+
     def __init__(self,
                  x_pos,
                  y_pos,
@@ -33,13 +45,24 @@ class Entity:
                  inventory=None,
                  stairs=None,
                  level=None):
-        self.x_pos = x_pos
-        self.y_pos = y_pos
+        self._store = UNPLACED
+        self._row = UNPLACED.allocate(self)
+
+        # The floor this entity is on, told whenever it moves or stops blocking
+        self.game_map = None
+
+        store, row = self._store, self._row
+        store.x[row] = x_pos
+        store.y[row] = y_pos
+        store.blocks[row] = blocks
+
         self.char = char
         self.color = color
         self.name = name
-        self.blocks = blocks
         self.render_order = render_order
+        self._fighter = None
+        self._ai = None
+        self._stairs = None
         self.fighter = fighter
         self.ai = ai
         self.item = item
@@ -47,56 +70,211 @@ class Entity:
         self.stairs = stairs
         self.level = level
 
-        if self.fighter:
-            self.fighter.owner = self
-
-        if self.ai:
-            self.ai.owner = self
-
         if self.item:
             self.item.owner = self
 
         if self.inventory:
             self.inventory.owner = self
 
-        if self.stairs:
-            self.stairs.owner = self
-
         if self.level:
             self.level.owner = self
 
+    def __getstate__(self):
+        # The floor is saved on its own and re-attaches its entities on load
+        return {
+            "x_pos": self.x_pos,
+            "y_pos": self.y_pos,
+            "char": self.char,
+            "color": tuple(self.color),
+            "name": self.name,
+            "blocks": self.blocks,
+            "render_order": self.render_order,
+            "fighter": self.fighter,
+            "ai": self.ai,
+            "item": self.item,
+            "inventory": self.inventory,
+            "stairs": self.stairs,
+            "level": self.level,
+        }
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def discard(self):
+        """ Give the entity's row back once it left play for good (e.g. a
+        used up item), after which the entity must not be used
+
+        """
+
+        self._store.release(self._row)
+        self._store = None
+        self._row = None
+        self.game_map = None
+
+    def move_to_store(self, store):
+        """ Move the entity's row to another store (e.g. its new floor's)
+
+        """
+
+        if store is self._store:
+            return
+
+        row = store.allocate(self)
+        store.copy_row(row, self._store, self._row)
+        self._store.release(self._row)
+
+        self._store = store
+        self._row = row
+
+    @property
+    def x_pos(self):
+        return self._store.x.item(self._row)
+
+    @x_pos.setter
+    def x_pos(self, value):
+        self.place(value, self.y_pos)
+
+    @property
+    def y_pos(self):
+        return self._store.y.item(self._row)
+
+    @y_pos.setter
+    def y_pos(self, value):
+        self.place(self.x_pos, value)
+
+    @property
+    def position(self):
+        """ (x, y), read from the store in one go
+
+        """
+
+        store, row = self._store, self._row
+        return store.x.item(row), store.y.item(row)
+
+    @property
+    def char(self):
+        return chr(self._store.char.item(self._row))
+
+    @char.setter
+    def char(self, value):
+        self._store.char[self._row] = ord(value)
+
+    @property
+    def color(self):
+        # The store's column is what gets drawn; the colour object is kept
+        # as given so reading it costs nothing
+        return self._color
+
+    @color.setter
+    def color(self, value):
+        self._color = value
+        self._store.color[self._row] = tuple(value)
+
+    @property
+    def render_order(self):
+        return RENDER_ORDERS[self._store.render_order.item(self._row)]
+
+    @render_order.setter
+    def render_order(self, value):
+        self._store.render_order[self._row] = value.value
+
+    @property
+    def blocks(self):
+        return self._store.blocks.item(self._row)
+
+    @blocks.setter
+    def blocks(self, value):
+        self._store.blocks[self._row] = value
+
+        if self.game_map:
+            self.game_map.entity_blocks_changed(self)
+
+    @property
+    def fighter(self):
+        return self._fighter
+
+    @fighter.setter
+    def fighter(self, fighter):
+        self._fighter = fighter
+        self._store.has_fighter[self._row] = fighter is not None
+
+        if fighter:
+            fighter.owner = self
+
+    @property
+    def ai(self):
+        return self._ai
+
+    @ai.setter
+    def ai(self, ai):
+        self._ai = ai
+        self._store.has_ai[self._row] = ai is not None
+
+        if ai:
+            ai.owner = self
+
+    @property
+    def stairs(self):
+        return self._stairs
+
+    @stairs.setter
+    def stairs(self, stairs):
+        self._stairs = stairs
+        self._store.has_stairs[self._row] = stairs is not None
+
+        if stairs:
+            stairs.owner = self
+
+    def place(self, x_pos, y_pos):
+        """ Put the entity at a coordinate, keeping its floor up to date
+
+        """
+
+        store, row = self._store, self._row
+
+        old_x_pos, old_y_pos = store.x.item(row), store.y.item(row)
+
+        store.x[row] = x_pos
+        store.y[row] = y_pos
+
+        if self.game_map:
+            self.game_map.entity_moved(self, old_x_pos, old_y_pos)
+
     def move(self, d_x, d_y):
         """ Move the entity by a given amount
 
         """
 
-        self.x_pos += d_x
-        self.y_pos += d_y
+        self.place(self.x_pos + d_x, self.y_pos + d_y)
 
     def move_towards(self, target_x, target_y, game_map, entities):
         """ Moves a non-player entity towards a target coordinate
 
         """
 
-        dx = target_x - self.x_pos
-        dy = target_y - self.y_pos
+        x_pos, y_pos = self.position
+
+        dx = target_x - x_pos
+        dy = target_y - y_pos
         distance = sqrt(dx**2 + dy**2)
 
         dx = int(round(dx / distance))
         dy = int(round(dy / distance))
 
-        if not (game_map.is_blocked(self.x_pos + dx, self.y_pos + dy)
-                or get_blocking_entities_at_location(entities, self.x_pos + dx,
-                                                     self.y_pos + dy)):
-            self.move(dx, dy)
+        if not (game_map.is_blocked(x_pos + dx, y_pos + dy)
+                or game_map.get_blocking_entity_at(x_pos + dx, y_pos + dy)):
+            self.place(x_pos + dx, y_pos + dy)
 
     def distance_to(self, other):
         """ Get distance between the Entity and its target
 
         """
 
-        dx = other.x_pos - self.x_pos
-        dy = other.y_pos - self.y_pos
+        other_x, other_y = other.position
+        x_pos, y_pos = self.position
+
+        dx = other_x - x_pos
+        dy = other_y - y_pos
         return sqrt(dx**2 + dy**2)
 
     def distance(self, x_pos, y_pos):
@@ -111,37 +289,25 @@ class Entity:
 
         """
 
-        # Create a FOV map that has the dimensions of the map
-        fov = tcod.map_new(game_map.width, game_map.height)
-
-        # Scan the current map each turn and set all the walls as unwalkable
-        for y_1 in range(game_map.height):
-            for x_1 in range(game_map.width):
-                tcod.map_set_properties(
-                    fov,
-                    x_1,
-                    y_1,
-                    not game_map.tiles[x_1][y_1].block_sight,
-                    not game_map.tiles[x_1][y_1].blocked,
-                )
-
-        # Scan all the objects to see if there are objects that must be navigated around
-        # Check also that the object isn't self or the target (so that the start and the end points are free)
-        # The AI class handles the situation if self is next to the target so it will not use this A* function anyway
-        for entity in entities:
-            if entity.blocks and entity != self and entity != target:
-                # Set the tile as a wall so it must be navigated around
-                tcod.map_set_properties(fov, entity.x_pos, entity.y_pos, True,
-                                        False)
+        # The floor keeps a navigation map with walls and blocking entities
+        # set as unwalkable, and a reusable A* path over it
+        walkable = game_map.nav_map.walkable
+        my_path = game_map.nav_path
 
-        # Allocate a A* path
-        # The 1.41 is the normal diagonal cost of moving, it can be set as 0.0 if diagonal moves are prohibited
-        my_path = tcod.path_new_using_map(fov, 1.41)
+        # Free self's and the target's tiles so the start and the end points are walkable
+        # The AI class handles the situation if self is next to the target so it will not use this A* function anyway
+        ends = ((self.x_pos, self.y_pos), (target.x_pos, target.y_pos))
+        ends_walkable = [walkable[end] for end in ends]
+        for end in ends:
+            walkable[end] = True
 
         # Compute the path between self's coordinates and the target's coordinates
         tcod.path_compute(my_path, self.x_pos, self.y_pos, target.x_pos,
                           target.y_pos)
 
+        for end, end_walkable in zip(ends, ends_walkable):
+            walkable[end] = end_walkable
+
         # Check if the path exists, and in this case, also the path is shorter than 25 tiles
         # The path size matters if you want the monster to use alternative longer paths (for example through other rooms) if for example the player is in a corridor
         # It makes sense to keep path size relatively low to keep the monsters from running around the map if there's an alternative path really far away
@@ -150,26 +316,29 @@ class Entity:
             x_pos, y_pos = tcod.path_walk(my_path, True)
             if x_pos or y_pos:
                 # Set self's coordinates to the next path tile
-                self.x_pos = x_pos
-                self.y_pos = y_pos
+                self.place(x_pos, y_pos)
         else:
             # Keep the old move function as a backup so that if there are no paths (for example another monster blocks a corridor)
             # it will still try to move towards the player (closer to the corridor opening)
             self.move_towards(target.x_pos, target.y_pos, game_map, entities)
 
-        # Delete the path to free memory
-        tcod.path_delete(my_path)
+    def move_flow(self, target, entities, game_map):
+        """ Step towards the target down the floor's shared distance field
 
+        """
 
-def get_blocking_entities_at_location(entities, destination_x, destination_y):
-    """ Return entity at target destination if the entity blocks
+        # The field is only recomputed when the target has moved, so every
+        # monster chasing the same target shares one computation
+        target_x, target_y = target.position
 
-    """
+        flow_field = game_map.flow_field
+        flow_field.update(game_map, target_x, target_y)
+
+        step = flow_field.next_step(*self.position, game_map.nav_map.walkable)
 
-    for entity in entities:
-        entity_at_position = (entity.x_pos == destination_x
-                              and entity.y_pos == destination_y)
-        if entity.blocks and entity_at_position:
-            return entity
+        if step:
+            self.place(*step)
+        else:
+            # Too far away, or every closer tile is taken by another entity
+            self.move_towards(target_x, target_y, game_map, entities)
 
-    return None
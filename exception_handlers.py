@@ -15,3 +15,10 @@ class EntityError(RLError):
     """ Entity error handling
 
     """
+
+
+class SaveFormatError(RLError):
+    """ Save file error handling (not a save, a version we cannot
+    read, or a damaged file)
+
+    """
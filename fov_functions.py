@@ -1,35 +1,146 @@
 """ Fov Functions:
 
 - create field of view
+- cache computed fields of view, so revisited spots skip the shadowcast
 
 """
 
+from collections import OrderedDict
+
+import numpy as np
 import tcod
 
 
+class FovCache:
+    """ The last few fields of view computed on a floor, least recent first
+
+    Entries are keyed by viewer position, radius, wall lighting and
+    algorithm. Only the square the radius can reach is stored, packed eight
+    tiles to a byte, so an entry is tiny next to the floor. The cache
+    belongs to a floor, and is cleared whenever one of its tiles changes.
+
+    The tcod map's fov is a strided view, slow to clear as a whole, so only
+    the square last written is cleared before copying an entry back. Fields
+    of view of a map kept with a cache must all be recomputed through it.
+
+    """
+
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+
+        # The fov map last written, and the only part of it that may be set
+        self.written_map = None
+        self.written_window = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        """ Forget every field of view (the floor changed)
+
+        """
+
+        self.entries.clear()
+
+    def restore(self, fov_map, key):
+        """ Copy a cached field of view into a fov map, if there is one
+
+        Returns whether it was found.
+
+        """
+
+        entry = self.entries.get(key)
+
+        if entry is None:
+            return False
+
+        self.entries.move_to_end(key)
+
+        window, packed = entry
+        height = window[0].stop - window[0].start
+        width = window[1].stop - window[1].start
+
+        fov = fov_map.fov
+
+        if self.written_map is fov_map:
+            fov[self.written_window] = False
+        else:
+            fov[...] = False
+
+        fov[window] = np.unpackbits(packed, count=height * width).reshape(
+            height, width).view(bool)
+
+        self.written_map = fov_map
+        self.written_window = window
+
+        return True
+
+    def store(self, fov_map, key, window):
+        """ Keep the part of a freshly computed field of view inside a window
+
+        """
+
+        self.entries[key] = (window, np.packbits(fov_map.fov[window]))
+        self.entries.move_to_end(key)
+
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+        self.written_map = fov_map
+        self.written_window = window
+
+
 def initialize_fov(game_map):
     """ Initialize the field of view
 
     """
 
-    fov_map = tcod.map_new(game_map.width, game_map.height)
+    fov_map = tcod.map.Map(game_map.width, game_map.height)
 
-    for y_pos in range(game_map.height):
-        for x_pos in range(game_map.width):
-            tcod.map_set_properties(
-                fov_map,
-                x_pos,
-                y_pos,
-                not game_map.tiles[x_pos][y_pos].block_sight,
-                not game_map.tiles[x_pos][y_pos].blocked,
-            )
+    # The map arrays are indexed [y, x], the tile layers [x, y]
+    fov_map.transparent[...] = ~game_map.block_sight.T
+    fov_map.walkable[...] = ~game_map.blocked.T
 
     return fov_map
 
 
-def recompute_fov(fov_map, x_pos, y_pos, radius, light_walls=True, algorithm=0):
+def fov_window(fov_map, x_pos, y_pos, radius):
+    """ The [y, x] slices of the square a field of view can reach
+
+    """
+
+    if radius <= 0:
+        # No radius means no limit
+        return (slice(0, fov_map.height), slice(0, fov_map.width))
+
+    return (slice(max(0, y_pos - radius), min(fov_map.height,
+                                              y_pos + radius + 1)),
+            slice(max(0, x_pos - radius), min(fov_map.width,
+                                              x_pos + radius + 1)))
+
+
+def recompute_fov(fov_map,
+                  x_pos,
+                  y_pos,
+                  radius,
+                  light_walls=True,
+                  algorithm=0,
+                  cache=None):
     """ Triggers a recompute of the field of view
 
+    With a FovCache, a field of view already computed from the same spot is
+    copied back instead.
+
     """
 
+    if cache is not None:
+        key = (x_pos, y_pos, radius, light_walls, algorithm)
+
+        if cache.restore(fov_map, key):
+            return
+
     tcod.map_compute_fov(fov_map, x_pos, y_pos, radius, light_walls, algorithm)
+
+    if cache is not None:
+        cache.store(fov_map, key, fov_window(fov_map, x_pos, y_pos, radius))
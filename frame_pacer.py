@@ -0,0 +1,88 @@
+""" Frame Pacer:
+
+- sleep until there is input, instead of polling for it
+- only draw frames when something may have changed
+- cap the frame rate
+
+"""
+
+import math
+import time
+
+import tcod
+from tcod.cffi import ffi, lib
+
+from phase_timer import NULL_TIMER
+
+# The events the key and mouse handlers read
+INPUT_EVENTS = tcod.EVENT_KEY_PRESS | tcod.EVENT_MOUSE
+
+
+class FramePacer:
+    """ Paces a main loop around input events
+
+    `wait` blocks until SDL has an event queued (any kind, so closing or
+    uncovering the window wakes it too) or `timeout` seconds pass, then reads
+    the next key press or mouse event into a tcod Key and Mouse, as
+    `sys_check_for_event` does. Any event means the screen may need drawing,
+    and `frame_due` says when to draw it: never while nothing happened, and
+    at most `frame_rate_cap` times a second (no cap if 0).
+
+    With a `timer` (a PhaseTimer), reading events is timed, but not the
+    sleep before it.
+
+    """
+
+    def __init__(self, frame_rate_cap=60, timeout=1.0, timer=None):
+        self.frame_time = 1 / frame_rate_cap if frame_rate_cap else 0
+        self.timeout = timeout
+        self.timer = NULL_TIMER if timer is None else timer
+
+        # Whether a frame is owed, and when the last one was drawn
+        self.redraw = True
+        self.last_frame = -math.inf
+
+    def changed(self):
+        """ Ask for a frame, for changes that came without input
+
+        """
+
+        self.redraw = True
+
+    def frame_due(self):
+        """ Whether to draw a frame now (and if so, count it as drawn)
+
+        """
+
+        if not self.redraw:
+            return False
+
+        now = time.perf_counter()
+
+        if now - self.last_frame < self.frame_time:
+            return False
+
+        self.redraw = False
+        self.last_frame = now
+
+        return True
+
+    def wait(self, key, mouse):
+        """ Sleep until there is an event, then read input into key and mouse
+
+        While a frame is owed, only sleep until the frame rate cap lets it be
+        drawn. Returns whether a key press or mouse event was read.
+
+        """
+
+        timeout = self.timeout
+        if self.redraw:
+            timeout = max(0, self.last_frame + self.frame_time -
+                          time.perf_counter())
+
+        # With no event to fill in, SDL leaves the event queued for tcod
+        if lib.SDL_WaitEventTimeout(ffi.NULL, math.ceil(timeout * 1000)):
+            self.redraw = True
+
+        with self.timer.phase("events"):
+            return tcod.sys_check_for_event(INPUT_EVENTS, key, mouse) != 0
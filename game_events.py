@@ -0,0 +1,113 @@
+""" Game Events:
+
+- the results of actions, one small class per kind of result
+
+Components return a list of events from every action (an attack, picking up
+an item, casting a spell), and Simulation resolves them through a dispatch
+table keyed by event type.
+
+"""
+
+
+class Event:
+    """ Base class of every event
+
+    """
+
+    __slots__ = ()
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}"
+                           for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class MessageEvent(Event):
+    """ A message for the message log
+
+    """
+
+    __slots__ = ("message", )
+
+    def __init__(self, message):
+        self.message = message
+
+
+class Dead(Event):
+    """ An entity died, leaving experience to whoever killed it
+
+    """
+
+    __slots__ = ("entity", "xp")
+
+    def __init__(self, entity, xp=0):
+        self.entity = entity
+        self.xp = xp
+
+
+class ItemAdded(Event):
+    """ An item was picked up (it is now in the inventory, off the floor)
+
+    """
+
+    __slots__ = ("item", )
+
+    def __init__(self, item):
+        self.item = item
+
+
+class ItemConsumed(Event):
+    """ An item was used up
+
+    """
+
+    __slots__ = ()
+
+
+class ItemDropped(Event):
+    """ An item was dropped (it is now on the floor)
+
+    """
+
+    __slots__ = ("item", )
+
+    def __init__(self, item):
+        self.item = item
+
+
+class Targeting(Event):
+    """ An item needs a target before it can be used
+
+    """
+
+    __slots__ = ("item", )
+
+    def __init__(self, item):
+        self.item = item
+
+
+class TargetingCancelled(Event):
+    """ The player gave up choosing a target
+
+    """
+
+    __slots__ = ()
+
+
+class NewFloor(Event):
+    """ The player took the stairs down
+
+    """
+
+    __slots__ = ("dungeon_level", )
+
+    def __init__(self, dungeon_level):
+        self.dungeon_level = dungeon_level
+
+
+class Exit(Event):
+    """ The player asked to leave the game
+
+    """
+
+    __slots__ = ()
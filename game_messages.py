@@ -2,10 +2,13 @@
 
 - message
 - message log
+- cached line wrapping
 
 """
 
 import textwrap
+from collections import deque
+from functools import lru_cache
 
 import tcod
 
@@ -15,18 +18,38 @@ class Message:
 
     """
 
+    __slots__ = ("text", "color")
+
     def __init__(self, text, color=tcod.white):
         self.text = text
         self.color = color
 
 
+@lru_cache(maxsize=1024)
+def wrap(text, width):
+    """ Split a text into lines of at most `width` characters
+
+    The same few messages come back over and over ("Orc attacks Player..."),
+    so the lines are cached by text and width.
+
+    """
+
+    return tuple(textwrap.wrap(text, width))
+
+
 class MessageLog:
     """ Collection of messages, as well as a reference to their position
 
+    `messages` holds the wrapped lines on display, and `history` the last
+    `history_size` messages as they were added, which saves keep to rebuild
+    the log. Both are ring buffers, so the oldest entries fall off at no
+    cost.
+
     """
 
-    def __init__(self, x, width, height):
-        self.messages = []
+    def __init__(self, x, width, height, history_size=100):
+        self.messages = deque(maxlen=height)
+        self.history = deque(maxlen=history_size)
         self.x = x
         self.width = width
         self.height = height
@@ -36,13 +59,10 @@ class MessageLog:
 
         """
 
-        # Split the message across multiple lines, if necessary
-        new_msg_lines = textwrap.wrap(message.text, self.width)
-
-        for line in new_msg_lines:
-            # If the buffer is full, remove the first line
-            if len(self.messages) == self.height:
-                del self.messages[0]
+        self.history.append(message)
 
-            # Add the new line as a Message object, with the text and the color
-            self.messages.append(Message(line, message.color))
+        # Split the message across multiple lines, if necessary, and let the
+        # buffer drop its oldest lines
+        color = message.color
+        self.messages.extend(
+            Message(line, color) for line in wrap(message.text, self.width))
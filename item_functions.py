@@ -6,10 +6,14 @@
 
 """
 
+import math
+
 import tcod
 
-from game_messages import Message
+from area_effects import damage_fighters, fighters_in_area, nearest_fighters
 from components.ai import ConfusedMonster
+from game_events import ItemConsumed, MessageEvent
+from game_messages import Message
 
 
 def heal(*args, **kwargs):
@@ -24,19 +28,14 @@ def heal(*args, **kwargs):
 
     if entity.fighter.hp == entity.fighter.max_hp:
         results.append(
-            {
-                "consumed": False,
-                "message": Message("You are already at full health", tcod.yellow),
-            }
-        )
+            MessageEvent(
+                Message("You are already at full health", tcod.yellow)))
     else:
         entity.fighter.heal(amount)
         results.append(
-            {
-                "consumed": True,
-                "message": Message("Your wounds start to feel better!", tcod.green),
-            }
-        )
+            MessageEvent(
+                Message("Your wounds start to feel better!", tcod.green)))
+        results.append(ItemConsumed())
 
     return results
 
@@ -47,47 +46,36 @@ def cast_lightning(*args, **kwargs):
     """
 
     caster = args[0]
-    entities = kwargs.get("entities")
     fov_map = kwargs.get("fov_map")
+    game_map = kwargs.get("game_map")
     damage = kwargs.get("damage")
     maximum_range = kwargs.get("maximum_range")
 
     results = []
 
-    target = None
-    closest_distance = maximum_range + 1
-
-    for entity in entities:
-        if (
-            entity.fighter
-            and entity != caster
-            and tcod.map_is_in_fov(fov_map, entity.x_pos, entity.y_pos)
-        ):
-            distance = caster.distance_to(entity)
-
-            if distance < closest_distance:
-                target = entity
-                closest_distance = distance
+    # The bolt reaches anything closer than one tile past its range. Squared
+    # distances between tiles are whole numbers, so this radius takes in
+    # every one of them below (range + 1) ** 2 and no more.
+    targets = nearest_fighters(game_map,
+                               caster.x_pos,
+                               caster.y_pos,
+                               math.sqrt((maximum_range + 1)**2 - 0.5),
+                               fov=fov_map.fov,
+                               exclude=caster)
+    target = targets[0] if targets else None
 
     if target:
         results.append(
-            {
-                "consumed": True,
-                "target": target,
-                "message": Message(
+            MessageEvent(
+                Message(
                     f"A lightning bolt strikes the {target.name} with a loud thunder! The damage is {damage}"
-                ),
-            }
-        )
+                )))
+        results.append(ItemConsumed())
         results.extend(target.fighter.take_damage(damage))
     else:
         results.append(
-            {
-                "consumed": False,
-                "target": None,
-                "message": Message("No enemy is close enough to strike.", tcod.red),
-            }
-        )
+            MessageEvent(
+                Message("No enemy is close enough to strike.", tcod.red)))
 
     return results
 
@@ -97,8 +85,8 @@ def cast_fireball(*args, **kwargs):
 
     """
 
-    entities = kwargs.get("entities")
     fov_map = kwargs.get("fov_map")
+    game_map = kwargs.get("game_map")
     damage = kwargs.get("damage")
     radius = kwargs.get("radius")
     target_x_pos = kwargs.get("target_x_pos")
@@ -108,36 +96,32 @@ def cast_fireball(*args, **kwargs):
 
     if not tcod.map_is_in_fov(fov_map, target_x_pos, target_y_pos):
         results.append(
-            {
-                "consumed": False,
-                "message": Message(
+            MessageEvent(
+                Message(
                     "You cannot target a tile outside your field of view.", tcod.yellow
-                ),
-            }
-        )
+                )))
         return results
 
     results.append(
-        {
-            "consumed": True,
-            "message": Message(
+        MessageEvent(
+            Message(
                 f"The fireball explodes, burning everything within {radius} tiles!",
                 tcod.orange,
-            ),
-        }
-    )
+            )))
+    results.append(ItemConsumed())
 
-    for entity in entities:
-        if entity.distance(target_x_pos, target_y_pos) <= radius and entity.fighter:
-            results.append(
-                {
-                    "message": Message(
-                        f"The {entity.name} gets burned for {damage} hit points.",
-                        tcod.orange,
-                    )
-                }
-            )
-            results.extend(entity.fighter.take_damage(damage))
+    store = game_map.entity_store
+    rows = fighters_in_area(game_map, target_x_pos, target_y_pos, radius)
+    damage_results = damage_fighters(store, rows, damage)
+
+    for row, damage_result in zip(rows.tolist(), damage_results):
+        results.append(
+            MessageEvent(
+                Message(
+                    f"The {store.handles[row].name} gets burned for {damage} hit points.",
+                    tcod.orange,
+                )))
+        results.extend(damage_result)
 
     return results
 
@@ -147,8 +131,8 @@ def cast_confuse(*args, **kwargs):
 
     """
 
-    entities = kwargs.get("entities")
     fov_map = kwargs.get("fov_map")
+    game_map = kwargs.get("game_map")
     target_x_pos = kwargs.get("target_x_pos")
     target_y_pos = kwargs.get("target_y_pos")
 
@@ -156,41 +140,33 @@ def cast_confuse(*args, **kwargs):
 
     if not tcod.map_is_in_fov(fov_map, target_x_pos, target_y_pos):
         results.append(
-            {
-                "consumed": False,
-                "message": Message(
+            MessageEvent(
+                Message(
                     "You cannot target a tile outside your field of view.", tcod.yellow
-                ),
-            }
-        )
+                )))
         return results
 
-    for entity in entities:
-        if entity.x_pos == target_x_pos and entity.y_pos == target_y_pos and entity.ai:
+    for entity in game_map.get_entities_at(target_x_pos, target_y_pos):
+        if entity.ai:
             confused_ai = ConfusedMonster(entity.ai)
 
             confused_ai.owner = entity
             entity.ai = confused_ai
 
             results.append(
-                {
-                    "consumed": True,
-                    "message": Message(
+                MessageEvent(
+                    Message(
                         f"The eyes of the {entity.name} look vacant, as he starts to stumble around!",
                         tcod.light_green,
-                    ),
-                }
-            )
+                    )))
+            results.append(ItemConsumed())
 
             break
-        else:
-            results.append(
-                {
-                    "consumed": False,
-                    "message": Message(
-                        "There is no targetable enemy at that location", tcod.yellow
-                    ),
-                }
-            )
+    else:
+        results.append(
+            MessageEvent(
+                Message(
+                    "There is no targetable enemy at that location", tcod.yellow
+                )))
 
     return results
@@ -14,6 +14,10 @@ def handle_keys(key, game_state):
 
     """
 
+    if key.vk == tcod.KEY_F3:
+        # F3: toggle the timings overlay, whatever the game is doing
+        return {"toggle_timings": True}
+
     if game_state == GameStates.PLAYERS_TURN:
         return handle_player_turn_keys(key)
     if game_state == GameStates.PLAYER_DEAD:
@@ -0,0 +1,92 @@
+""" Autosave:
+
+- save the game periodically without stalling the game loop
+- snapshot on the main thread, encode and write on a worker thread
+
+"""
+
+import threading
+
+from loader_functions.data_loaders import SAVE_FILE, write_save_file
+from loader_functions.save_format import encode_snapshot, snapshot_game
+
+
+class AutoSaver:
+    """ Background saver, fed game snapshots by the main loop
+
+    Taking a snapshot only copies the game state into plain data, so the main
+    loop never waits on encoding or the disk. Only the latest snapshot is
+    kept: if the worker is still writing when the next one arrives, the one
+    waiting in between is dropped.
+
+    """
+
+    def __init__(self, path=SAVE_FILE):
+        self.path = path
+
+        self.condition = threading.Condition()
+        self.pending = None
+        self.closed = False
+
+        # Number of completed saves, and the last failure (if any)
+        self.saves = 0
+        self.error = None
+
+        self.thread = threading.Thread(target=self.run,
+                                       name='autosave',
+                                       daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def save(self, player, entities, game_map, message_log, game_state):
+        """ Snapshot the game and queue it to be written
+
+        """
+
+        snapshot = snapshot_game(player, entities, game_map, message_log,
+                                 game_state)
+
+        with self.condition:
+            self.pending = snapshot
+            self.condition.notify()
+
+    def run(self):
+        """ Worker loop: write snapshots until closed
+
+        """
+
+        while True:
+            with self.condition:
+                while self.pending is None and not self.closed:
+                    self.condition.wait()
+
+                if self.pending is None:
+                    return
+
+                snapshot = self.pending
+                self.pending = None
+
+            try:
+                write_save_file(encode_snapshot(snapshot), self.path)
+            except Exception as error:
+                # A failed autosave must not end the game (nor the worker,
+                # or nothing would be saved again); the next one tries again
+                self.error = error
+            else:
+                self.saves += 1
+
+    def close(self):
+        """ Write any queued snapshot, then stop the worker
+
+        """
+
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+        self.thread.join()
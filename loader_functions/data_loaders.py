@@ -1,11 +1,41 @@
 """ Data Loaders:
 
-- save / load game state via shelve
+- save / load game state in the binary save format (see save_format)
+- write save files atomically
 
 """
 
 import os
-import shelve
+import tempfile
+
+from loader_functions.save_format import (decode_game, encode_snapshot,
+                                          snapshot_game)
+
+SAVE_FILE = 'savegame.sav'
+
+
+def write_save_file(data, path=SAVE_FILE):
+    """ Write a save file, replacing any previous one in a single step
+
+    The data goes to a temporary file next to the save first, so a crash
+    midway leaves the previous save intact rather than a truncated one.
+
+    """
+
+    directory = os.path.dirname(os.path.abspath(path))
+    file_descriptor, temporary_path = tempfile.mkstemp(prefix='.savegame-',
+                                                       dir=directory)
+
+    try:
+        with os.fdopen(file_descriptor, 'wb') as data_file:
+            data_file.write(data)
+            data_file.flush()
+            os.fsync(data_file.fileno())
+
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
 
 
 def save_game(player, entities, game_map, message_log, game_state):
@@ -13,12 +43,10 @@ def save_game(player, entities, game_map, message_log, game_state):
 
     """
 
-    with shelve.open('savegame', 'n') as data_file:
-        data_file['player_index'] = entities.index(player)
-        data_file['entities'] = entities
-        data_file['game_map'] = game_map
-        data_file['message_log'] = message_log
-        data_file['game_state'] = game_state
+    snapshot = snapshot_game(player, entities, game_map, message_log,
+                             game_state)
+
+    write_save_file(encode_snapshot(snapshot))
 
 
 def load_game():
@@ -26,16 +54,10 @@ def load_game():
 
     """
 
-    if not os.path.isfile('savegame.dat'):
+    if not os.path.isfile(SAVE_FILE):
         raise FileNotFoundError
 
-    with shelve.open('savegame', 'r') as data_file:
-        player_index = data_file['player_index']
-        entities = data_file['entities']
-        game_map = data_file['game_map']
-        message_log = data_file['message_log']
-        game_state = data_file['game_state']
-
-    player = entities[player_index]
+    with open(SAVE_FILE, 'rb') as data_file:
+        data = data_file.read()
 
-    return player, entities, game_map, message_log, game_state
+    return decode_game(data)
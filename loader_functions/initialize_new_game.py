@@ -1,3 +1,5 @@
+import random
+
 import tcod
 
 from components.fighter import Fighter
@@ -19,6 +21,11 @@ def get_constants():
 
     # Display
     SDL_2_RENDERER = 3
+    # Frames are only drawn when something changed, and at most this many
+    # times a second; the main loop sleeps up to INPUT_TIMEOUT seconds at a
+    # time waiting for input
+    FRAME_RATE_CAP = 60
+    INPUT_TIMEOUT = 1.0
 
     # Screen
     SCREEN_WIDTH = 80
@@ -42,6 +49,9 @@ def get_constants():
     # Map
     MAP_WIDTH = 80
     MAP_HEIGHT = 43
+    # How floors are laid out: 'rooms' (random rooms), 'bsp' (rooms in a
+    # binary space partition) or 'caves' (cellular automaton caves)
+    MAP_GENERATOR = 'rooms'
 
     # Room
     ROOM_MAX_SIZE = 10
@@ -49,9 +59,28 @@ def get_constants():
     MAX_ROOMS = 30
 
     # Monsters
+    # Chasing monsters follow a shared distance field rooted at the player,
+    # up to this path length away
+    FLOW_FIELD_RADIUS = 25
+    # Monsters only take turns while awake: they wake up when they come into
+    # view or hear combat within the noise radius, and fall back asleep after
+    # this many turns out of view
+    MONSTER_DORMANCY_TURNS = 20
+    NOISE_RADIUS = 8
+    # Whether monsters woken by a noise out of view go to where it came from
+    MONSTERS_FOLLOW_NOISE = False
     MAX_MONSTERS_PER_ROOM = 3
     MAX_ITEMS_PER_ROOM = 2
 
+    # Saving
+    # The game is saved in the background every this many turns
+    AUTOSAVE_TURNS = 25
+
+    # Diagnostics
+    # Timings of each phase of the main loop (turns and frames) are written
+    # here on leaving the game; F3 shows them on screen
+    TIMINGS_FILE = 'timings.json'
+
     COLORS = {
         "dark_wall": tcod.Color(0, 0, 100),  # dark blue
         "dark_ground": tcod.Color(50, 50, 150),  # light blue
@@ -62,6 +91,8 @@ def get_constants():
     constants = {
         'window_title': WINDOW_TITLE,
         'sdl_renderer': SDL_2_RENDERER,
+        'frame_rate_cap': FRAME_RATE_CAP,
+        'input_timeout': INPUT_TIMEOUT,
         'screen_width': SCREEN_WIDTH,
         'screen_height': SCREEN_HEIGHT,
         'bar_width': BAR_WIDTH,
@@ -72,23 +103,32 @@ def get_constants():
         'message_height': MESSAGE_HEIGHT,
         'map_width': MAP_WIDTH,
         'map_height': MAP_HEIGHT,
+        'map_generator': MAP_GENERATOR,
         'room_max_size': ROOM_MAX_SIZE,
         'room_min_size': ROOM_MIN_SIZE,
         'max_rooms': MAX_ROOMS,
         'fov_algorithm': FOV_ALGORITHM,
         'fov_light_walls': FOV_LIGHT_WALLS,
         'fov_radius': FOV_RADIUS,
+        'flow_field_radius': FLOW_FIELD_RADIUS,
+        'monster_dormancy_turns': MONSTER_DORMANCY_TURNS,
+        'noise_radius': NOISE_RADIUS,
+        'monsters_follow_noise': MONSTERS_FOLLOW_NOISE,
         'max_monsters_per_room': MAX_MONSTERS_PER_ROOM,
         'max_items_per_room': MAX_ITEMS_PER_ROOM,
+        'autosave_turns': AUTOSAVE_TURNS,
+        'timings_file': TIMINGS_FILE,
         'colors': COLORS,
     }
 
     return constants
 
 
-def get_game_variables(constants):
+def get_game_variables(constants, rng=random):
     """ Initialize player, entities list, and game map
 
+    The first floor is laid out with `rng` (see RandomStreams).
+
     """
 
     fighter_component = Fighter(hp=30, defense=2, power=5)
@@ -107,7 +147,9 @@ def get_game_variables(constants):
         level=level_component)
     entities = [player]
 
-    game_map = GameMap(constants["map_width"], constants["map_height"])
+    game_map = GameMap(constants["map_width"],
+                       constants["map_height"],
+                       flow_field_radius=constants["flow_field_radius"])
     game_map.make_map(
         constants["max_rooms"],
         constants["room_min_size"],
@@ -118,6 +160,8 @@ def get_game_variables(constants):
         entities,
         constants["max_monsters_per_room"],
         constants["max_items_per_room"],
+        rng,
+        constants["map_generator"],
     )
 
     message_log = MessageLog(constants["message_x"],
@@ -0,0 +1,503 @@
+""" Save Format:
+
+- versioned binary save format
+- snapshot the game state into plain data
+- encode a snapshot to bytes / decode bytes back into a game
+
+Layout (all integers little-endian):
+
+    header   magic "PYRL", u16 version, u16 flags (1 = zlib compressed)
+    body     game state name
+             map: width, height, dungeon level, flow field radius,
+                  the blocked / block_sight / explored layers as packed bits
+             message log: x, width, height, then (color, text) per message
+                  of the history, oldest first (wrapped lines before the
+                  log kept a history, which load back the same)
+             entities: player index, number on the floor, then one record
+                  per entity (floor entities first, then carried items)
+
+"""
+
+import struct
+import zlib
+from collections import namedtuple
+
+import numpy as np
+import tcod
+
+import item_functions
+from components.ai import BasicMonster, ConfusedMonster
+from components.fighter import Fighter
+from components.inventory import Inventory
+from components.item import Item
+from components.level import Level
+from components.stairs import Stairs
+from entity import Entity
+from exception_handlers import SaveFormatError
+from game_messages import Message, MessageLog
+from game_states import GameStates
+from map_objects.game_map import GameMap
+from render_functions import RenderOrder
+
+MAGIC = b"PYRL"
+VERSION = 1
+
+FLAG_COMPRESSED = 1
+
+# Which components an entity record holds
+HAS_FIGHTER = 1
+HAS_AI = 2
+HAS_ITEM = 4
+HAS_INVENTORY = 8
+HAS_STAIRS = 16
+HAS_LEVEL = 32
+BLOCKS = 64
+
+AI_BASIC = 0
+AI_CONFUSED = 1
+
+VALUE_INT = 0
+VALUE_FLOAT = 1
+VALUE_STR = 2
+
+GameSnapshot = namedtuple("GameSnapshot", [
+    "game_state", "map_info", "layers", "log_info", "messages",
+    "player_index", "floor_count", "records"
+])
+
+
+def color_to_rgb(color):
+    """ A color as an (r, g, b) tuple
+
+    """
+
+    return (color[0], color[1], color[2])
+
+
+def snapshot_ai(ai):
+    """ An AI component as nested tuples
+
+    """
+
+    if isinstance(ai, ConfusedMonster):
+        return (AI_CONFUSED, ai.number_of_turns, snapshot_ai(ai.previous_ai))
+
+    return (AI_BASIC, ai.noise)
+
+
+def snapshot_entity(entity, index_of):
+    """ An entity and its components as a record of plain values
+
+    """
+
+    flags = BLOCKS if entity.blocks else 0
+    fighter = ai = item = inventory = stairs = level = None
+
+    if entity.fighter:
+        flags |= HAS_FIGHTER
+        fighter = (entity.fighter.max_hp, entity.fighter.hp,
+                   entity.fighter.defense, entity.fighter.power,
+                   entity.fighter.xp)
+
+    if entity.ai:
+        flags |= HAS_AI
+        ai = snapshot_ai(entity.ai)
+
+    if entity.item:
+        flags |= HAS_ITEM
+        message = entity.item.targeting_message
+        item = (entity.item.use_function.__name__
+                if entity.item.use_function else "", entity.item.targeting,
+                (color_to_rgb(message.color), message.text)
+                if message else None,
+                tuple(entity.item.function_kwargs.items()))
+
+    if entity.inventory:
+        flags |= HAS_INVENTORY
+        inventory = (entity.inventory.capacity,
+                     tuple(index_of[id(carried)]
+                           for carried in entity.inventory.items))
+
+    if entity.stairs:
+        flags |= HAS_STAIRS
+        stairs = entity.stairs.floor
+
+    if entity.level:
+        flags |= HAS_LEVEL
+        level = (entity.level.current_level, entity.level.current_xp,
+                 entity.level.level_up_base, entity.level.level_up_factor)
+
+    return (flags, entity.x_pos, entity.y_pos, ord(entity.char),
+            color_to_rgb(entity.color), entity.name,
+            entity.render_order.name, fighter, ai, item, inventory, stairs,
+            level)
+
+
+def snapshot_game(player, entities, game_map, message_log, game_state):
+    """ Copy the game state into plain data, cheap enough for the main loop
+
+    The snapshot shares nothing mutable with the game, so it can be encoded
+    elsewhere (e.g. on a worker thread) while the game carries on.
+
+    """
+
+    # Carried items are not on the floor, but still need saving
+    all_entities = list(entities)
+    for entity in entities:
+        if entity.inventory:
+            all_entities.extend(entity.inventory.items)
+
+    index_of = {id(entity): index for index, entity in enumerate(all_entities)}
+
+    return GameSnapshot(
+        game_state=game_state.name,
+        map_info=(game_map.width, game_map.height, game_map.dungeon_level,
+                  game_map.flow_field.radius),
+        layers=(game_map.blocked.copy(order="F"),
+                game_map.block_sight.copy(order="F"),
+                game_map.explored.copy(order="F")),
+        log_info=(message_log.x, message_log.width, message_log.height),
+        messages=tuple((color_to_rgb(message.color), message.text)
+                       for message in message_log.history),
+        player_index=index_of[id(player)],
+        floor_count=len(entities),
+        records=[snapshot_entity(entity, index_of) for entity in all_entities],
+    )
+
+
+class Writer:
+    """ Appends little-endian values to a byte buffer
+
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def pack(self, fmt, *values):
+        self.chunks.append(struct.pack("<" + fmt, *values))
+
+    def string(self, text):
+        data = text.encode("utf-8")
+        self.pack("I", len(data))
+        self.chunks.append(data)
+
+    def color(self, rgb):
+        self.pack("3B", *rgb)
+
+    def value(self, value):
+        if isinstance(value, bool) or isinstance(value, int):
+            self.pack("Bq", VALUE_INT, value)
+        elif isinstance(value, float):
+            self.pack("Bd", VALUE_FLOAT, value)
+        else:
+            self.pack("B", VALUE_STR)
+            self.string(str(value))
+
+    def getvalue(self):
+        return b"".join(self.chunks)
+
+
+class Reader:
+    """ Reads little-endian values back out of a byte buffer
+
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.offset = 0
+
+    def unpack(self, fmt):
+        fmt = "<" + fmt
+        values = struct.unpack_from(fmt, self.data, self.offset)
+        self.offset += struct.calcsize(fmt)
+        return values
+
+    def one(self, fmt):
+        return self.unpack(fmt)[0]
+
+    def raw(self, size):
+        data = self.data[self.offset:self.offset + size]
+        if len(data) != size:
+            raise SaveFormatError("Truncated save file")
+        self.offset += size
+        return data
+
+    def string(self):
+        return self.raw(self.one("I")).decode("utf-8")
+
+    def color(self):
+        return tcod.Color(*self.unpack("3B"))
+
+    def value(self):
+        kind = self.one("B")
+
+        if kind == VALUE_INT:
+            return self.one("q")
+        if kind == VALUE_FLOAT:
+            return self.one("d")
+        return self.string()
+
+
+def write_ai(writer, ai):
+    """ Encode a (possibly nested) AI tuple
+
+    """
+
+    if ai[0] == AI_CONFUSED:
+        writer.pack("Bh", AI_CONFUSED, ai[1])
+        write_ai(writer, ai[2])
+    else:
+        noise = ai[1]
+        writer.pack("B?", AI_BASIC, noise is not None)
+        if noise is not None:
+            writer.pack("2i", *noise)
+
+
+def encode_snapshot(snapshot, compress=True):
+    """ Encode a snapshot into the binary save format
+
+    """
+
+    writer = Writer()
+
+    writer.string(snapshot.game_state)
+
+    (width, height, dungeon_level, flow_field_radius) = snapshot.map_info
+    writer.pack("4I", width, height, dungeon_level, flow_field_radius)
+
+    for layer in snapshot.layers:
+        # [x, y] layers are packed in [y, x] row order
+        packed = np.packbits(layer.T.ravel())
+        writer.pack("I", len(packed))
+        writer.chunks.append(packed.tobytes())
+
+    writer.pack("3I", *snapshot.log_info)
+    writer.pack("I", len(snapshot.messages))
+    for (rgb, text) in snapshot.messages:
+        writer.color(rgb)
+        writer.string(text)
+
+    writer.pack("3I", snapshot.player_index, snapshot.floor_count,
+                len(snapshot.records))
+
+    for (flags, x_pos, y_pos, char, rgb, name, render_order, fighter, ai,
+         item, inventory, stairs, level) in snapshot.records:
+        writer.pack("B2iI", flags, x_pos, y_pos, char)
+        writer.color(rgb)
+        writer.string(name)
+        writer.string(render_order)
+
+        if fighter:
+            writer.pack("5i", *fighter)
+        if ai:
+            write_ai(writer, ai)
+        if item:
+            (use_function, targeting, message, kwargs) = item
+            writer.string(use_function)
+            writer.pack("??", targeting, message is not None)
+            if message:
+                writer.color(message[0])
+                writer.string(message[1])
+            writer.pack("B", len(kwargs))
+            for (key, value) in kwargs:
+                writer.string(key)
+                writer.value(value)
+        if inventory:
+            (capacity, items) = inventory
+            writer.pack("2I", capacity, len(items))
+            writer.pack(f"{len(items)}I", *items)
+        if stairs is not None:
+            writer.pack("I", stairs)
+        if level:
+            writer.pack("4i", *level)
+
+    body = writer.getvalue()
+    flags = 0
+
+    if compress:
+        body = zlib.compress(body)
+        flags |= FLAG_COMPRESSED
+
+    return MAGIC + struct.pack("<HH", VERSION, flags) + body
+
+
+def read_ai(reader):
+    """ Decode a (possibly nested) AI component
+
+    """
+
+    kind = reader.one("B")
+
+    if kind == AI_CONFUSED:
+        number_of_turns = reader.one("h")
+        return ConfusedMonster(read_ai(reader), number_of_turns)
+
+    ai = BasicMonster()
+    if reader.one("?"):
+        ai.hear(*reader.unpack("2i"))
+
+    return ai
+
+
+def read_entity(reader):
+    """ Decode an entity record, returning it with its carried item indices
+
+    """
+
+    (flags, x_pos, y_pos, char) = reader.unpack("B2iI")
+    color = reader.color()
+    name = reader.string()
+    render_order = RenderOrder[reader.string()]
+
+    fighter = ai = item = inventory = stairs = level = None
+    carried = ()
+
+    if flags & HAS_FIGHTER:
+        (max_hp, hp, defense, power, xp) = reader.unpack("5i")
+        fighter = Fighter(max_hp, defense, power, xp)
+        fighter.hp = hp
+
+    if flags & HAS_AI:
+        ai = read_ai(reader)
+
+    if flags & HAS_ITEM:
+        use_function_name = reader.string()
+        (targeting, has_message) = reader.unpack("??")
+        targeting_message = None
+        if has_message:
+            color_of_message = reader.color()
+            targeting_message = Message(reader.string(), color_of_message)
+        kwargs = {}
+        for _ in range(reader.one("B")):
+            key = reader.string()
+            kwargs[key] = reader.value()
+
+        use_function = None
+        if use_function_name:
+            use_function = getattr(item_functions, use_function_name, None)
+            if use_function is None:
+                raise SaveFormatError(
+                    f"Unknown item function '{use_function_name}'")
+
+        item = Item(use_function, targeting, targeting_message, **kwargs)
+
+    if flags & HAS_INVENTORY:
+        (capacity, count) = reader.unpack("2I")
+        inventory = Inventory(capacity)
+        carried = reader.unpack(f"{count}I")
+
+    if flags & HAS_STAIRS:
+        stairs = Stairs(reader.one("I"))
+
+    if flags & HAS_LEVEL:
+        level = Level(*reader.unpack("4i"))
+
+    entity = Entity(x_pos,
+                    y_pos,
+                    chr(char),
+                    color,
+                    name,
+                    blocks=bool(flags & BLOCKS),
+                    render_order=render_order,
+                    fighter=fighter,
+                    ai=ai,
+                    item=item,
+                    inventory=inventory,
+                    stairs=stairs,
+                    level=level)
+
+    # A confused monster's own AI is restored to it later
+    if isinstance(ai, ConfusedMonster):
+        ai.previous_ai.owner = entity
+
+    return entity, carried
+
+
+# What a damaged body raises while it is read back
+DECODE_ERRORS = (zlib.error, struct.error, UnicodeDecodeError, KeyError,
+                 IndexError, ValueError, OverflowError)
+
+
+def decode_game(data):
+    """ Rebuild a game from the binary save format
+
+    Files that are not saves, of another version, truncated or otherwise
+    damaged all raise SaveFormatError.
+
+    """
+
+    header_size = len(MAGIC) + struct.calcsize("<HH")
+
+    if len(data) < header_size or data[:len(MAGIC)] != MAGIC:
+        raise SaveFormatError("Not a save file")
+
+    (version, flags) = struct.unpack_from("<HH", data, len(MAGIC))
+
+    if version != VERSION:
+        raise SaveFormatError(f"Unsupported save version {version}")
+
+    body = data[header_size:]
+
+    try:
+        if flags & FLAG_COMPRESSED:
+            body = zlib.decompress(body)
+
+        return read_game(Reader(body))
+    except DECODE_ERRORS as error:
+        raise SaveFormatError(f"Damaged save file: {error}") from error
+
+
+def read_game(reader):
+    """ Decode the body of a save
+
+    """
+
+    game_state = GameStates[reader.string()]
+
+    (width, height, dungeon_level, flow_field_radius) = reader.unpack("4I")
+
+    # The layers are read before the map is made, so a damaged size is
+    # caught before it is allocated
+    packed_layers = [
+        np.frombuffer(reader.raw(reader.one("I")), dtype=np.uint8)
+        for _ in range(3)
+    ]
+    if any(len(packed) != (width * height + 7) // 8
+           for packed in packed_layers):
+        raise SaveFormatError("Tile layers do not match the map size")
+
+    game_map = GameMap(width,
+                       height,
+                       dungeon_level,
+                       flow_field_radius=flow_field_radius)
+
+    for layer, packed in zip(
+            (game_map.blocked, game_map.block_sight, game_map.explored),
+            packed_layers):
+        bits = np.unpackbits(packed)[:width * height]
+        layer[...] = bits.reshape(height, width).T.astype(bool)
+
+    message_log = MessageLog(*reader.unpack("3I"))
+    for _ in range(reader.one("I")):
+        color = reader.color()
+        message_log.add_message(Message(reader.string(), color))
+
+    (player_index, floor_count, record_count) = reader.unpack("3I")
+
+    all_entities = []
+    carried_by = []
+    for _ in range(record_count):
+        entity, carried = read_entity(reader)
+        all_entities.append(entity)
+        carried_by.append(carried)
+
+    for entity, carried in zip(all_entities, carried_by):
+        for index in carried:
+            entity.inventory.items.append(all_entities[index])
+
+    entities = all_entities[:floor_count]
+    player = all_entities[player_index]
+
+    game_map.attach_entities(entities)
+
+    return player, entities, game_map, message_log, game_state
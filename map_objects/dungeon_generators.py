@@ -0,0 +1,314 @@
+""" Dungeon Generators:
+
+- lay out floors on whole tile arrays rather than tile by tile
+- BSP: split the map into leaves, one room per leaf, tunnels between siblings
+- caves: random noise smoothed by a cellular automaton
+- label the connected regions of a floor, and tunnel them together
+
+Floors are boolean `[x, y]` arrays, True where the tile is passable, laid
+out like the GameMap tile layers.
+
+"""
+
+import numpy as np
+
+from map_objects.rectangle import Rect
+
+# Share of the tiles that start as walls in the cave noise
+CAVE_WALL_CHANCE = 0.45
+# Smoothing passes of the cave automaton
+CAVE_STEPS = 4
+# Cave regions smaller than this many tiles are filled in rather than joined
+CAVE_MIN_REGION = 16
+
+
+def new_floor(width, height):
+    """ A floor with every tile a wall
+
+    """
+
+    return np.zeros((width, height), dtype=bool, order="F")
+
+
+def carve_tunnel(floor, start, end, horizontal_first):
+    """ Carve an L-shaped tunnel between two tiles
+
+    """
+
+    (x_1, y_1), (x_2, y_2) = start, end
+
+    # The tunnel turns at the corner between its two legs
+    if horizontal_first:
+        corner_x, corner_y = x_2, y_1
+    else:
+        corner_x, corner_y = x_1, y_2
+
+    floor[min(x_1, x_2):max(x_1, x_2) + 1, corner_y] = True
+    floor[corner_x, min(y_1, y_2):max(y_1, y_2) + 1] = True
+
+
+def bsp_rooms(width, height, room_min_size, room_max_size, rng):
+    """ Rooms in the leaves of a binary space partition of the map
+
+    The map is split in two along its longer side, again and again, until
+    the parts are too small to hold two rooms. Each leaf gets a room, and
+    the two halves of every split are joined by a tunnel between one room
+    of each, so the floor is connected by construction.
+
+    Returns the floor and its rooms, from one corner of the map to the
+    other. The number of rooms grows with the map's area.
+
+    """
+
+    floor = new_floor(width, height)
+    rooms = []
+
+    # A leaf holds a room of the largest size with a wall to spare
+    leaf_size = room_max_size + 1
+
+    def split(x_pos, y_pos, leaf_width, leaf_height):
+        """ Lay out a part of the map, returning one of its rooms
+
+        """
+
+        if max(leaf_width, leaf_height) >= 2 * leaf_size:
+            if leaf_width >= leaf_height:
+                cut = rng.randint(leaf_size, leaf_width - leaf_size)
+                first = split(x_pos, y_pos, cut, leaf_height)
+                second = split(x_pos + cut, y_pos, leaf_width - cut,
+                               leaf_height)
+            else:
+                cut = rng.randint(leaf_size, leaf_height - leaf_size)
+                first = split(x_pos, y_pos, leaf_width, cut)
+                second = split(x_pos, y_pos + cut, leaf_width,
+                               leaf_height - cut)
+
+            carve_tunnel(floor, first.center(), second.center(),
+                         rng.randint(0, 1) == 1)
+
+            return first if rng.randint(0, 1) == 1 else second
+
+        # The walls of a room are at x_2 and y_2, so they must be in the leaf
+        room_width = rng.randint(room_min_size,
+                                 min(room_max_size, leaf_width - 1))
+        room_height = rng.randint(room_min_size,
+                                  min(room_max_size, leaf_height - 1))
+        room = Rect(rng.randint(x_pos, x_pos + leaf_width - room_width - 1),
+                    rng.randint(y_pos, y_pos + leaf_height - room_height - 1),
+                    room_width, room_height)
+
+        floor[room.x_1 + 1:room.x_2, room.y_1 + 1:room.y_2] = True
+        rooms.append(room)
+
+        return room
+
+    split(0, 0, width, height)
+
+    return floor, rooms
+
+
+def count_neighbours(walls):
+    """ Number of walls in the 3x3 square around every tile, itself included
+
+    Tiles off the map count as walls.
+
+    """
+
+    padded = np.pad(walls.astype(np.uint8), 1, "constant", constant_values=1)
+
+    # The square is summed one axis at a time: 4 additions instead of 8
+    rows = padded[:-2] + padded[1:-1] + padded[2:]
+
+    return rows[:, :-2] + rows[:, 1:-1] + rows[:, 2:]
+
+
+def cave_floor(width, height, noise, wall_chance=CAVE_WALL_CHANCE,
+               steps=CAVE_STEPS):
+    """ Caves grown from random noise (a numpy RandomState)
+
+    Each step, a tile becomes a wall when most of the 3x3 square around it
+    is walls, and floor otherwise. The edges of the map stay walls.
+
+    """
+
+    walls = np.asfortranarray(
+        noise.random_sample((width, height)) < wall_chance)
+
+    for _ in range(steps):
+        walls = count_neighbours(walls) >= 5
+
+    walls[[0, -1], :] = True
+    walls[:, [0, -1]] = True
+
+    return np.asfortranarray(~walls)
+
+
+def label_regions(floor):
+    """ Label the regions of a floor connected by orthogonal steps
+
+    Returns the label of every tile as a `[y, x]` array (-1 for walls) and
+    the tile count of every label. Labels are not consecutive: unused ones
+    have a count of 0.
+
+    Tiles are grouped into horizontal runs, and runs touching across rows
+    are merged with a vectorized union-find, so the cost grows with the
+    number of runs rather than tiles.
+
+    """
+
+    width, height = floor.shape
+    tiles = np.ascontiguousarray(floor.T).ravel()
+
+    if not tiles.any():
+        return np.full((height, width), -1), np.zeros(0, dtype=np.intp)
+
+    # A run starts at a floor tile with no floor tile on its left
+    starts = tiles.copy()
+    starts[1:] &= ~tiles[:-1]
+    starts[::width] = tiles[::width]
+    run_of_tile = np.cumsum(starts) - 1
+    run_count = int(run_of_tile[-1]) + 1
+
+    # Runs touching across two rows, each pair once
+    touching = tiles[:-width] & tiles[width:]
+    above = run_of_tile[:-width][touching]
+    below = run_of_tile[width:][touching]
+    repeated = np.zeros(len(above), dtype=bool)
+    repeated[1:] = (above[1:] == above[:-1]) & (below[1:] == below[:-1])
+    above = above[~repeated]
+    below = below[~repeated]
+
+    # Every run points at the lowest run of its region once merged
+    parent = np.arange(run_count)
+
+    while len(above):
+        root_above = parent[above]
+        root_below = parent[below]
+        apart = root_above != root_below
+
+        above, below = above[apart], below[apart]
+        root_above, root_below = root_above[apart], root_below[apart]
+
+        np.minimum.at(parent, np.maximum(root_above, root_below),
+                      np.minimum(root_above, root_below))
+
+        # Point every run straight at its root again
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                break
+            parent = grandparent
+
+    labels = np.where(tiles, parent[run_of_tile], -1)
+    sizes = np.bincount(labels[tiles], minlength=run_count)
+
+    return labels.reshape(height, width), sizes
+
+
+def connect_regions(floor, rng, min_region=CAVE_MIN_REGION):
+    """ Join the regions of a floor into one, in place
+
+    Regions smaller than `min_region` tiles are filled in. The others are
+    joined to the largest by a tunnel to its nearest tile.
+
+    """
+
+    labels, sizes = label_regions(floor)
+
+    if not sizes.any():
+        return
+
+    small = (sizes > 0) & (sizes < min_region)
+    small[sizes.argmax()] = False
+    floor.T[small[np.maximum(labels, 0)] & (labels >= 0)] = False
+
+    main = sizes.argmax()
+    others = np.flatnonzero(sizes >= min_region)
+    others = others[others != main]
+
+    if not len(others):
+        return
+
+    # The main region as horizontal runs: row, first and last column
+    in_main = labels == main
+    run_starts = in_main.copy()
+    run_starts[:, 1:] &= ~in_main[:, :-1]
+    run_ends = in_main.copy()
+    run_ends[:, :-1] &= ~in_main[:, 1:]
+    run_y, run_x_1 = np.nonzero(run_starts)
+    run_x_2 = np.nonzero(run_ends)[1]
+
+    # Each region is tunnelled from its first tile in reading order
+    width = labels.shape[1]
+    flat_labels = labels.ravel()
+    first_tiles = np.flatnonzero(
+        (flat_labels >= 0) & np.isin(flat_labels, others))
+    first_tiles = first_tiles[np.unique(flat_labels[first_tiles],
+                                        return_index=True)[1]]
+
+    for tile in first_tiles.tolist():
+        y_pos, x_pos = divmod(tile, width)
+
+        d_x = np.maximum(np.maximum(run_x_1 - x_pos, x_pos - run_x_2), 0)
+        d_y = run_y - y_pos
+        nearest = int(np.argmin(d_x * d_x + d_y * d_y))
+        target_x = min(max(x_pos, int(run_x_1[nearest])),
+                       int(run_x_2[nearest]))
+
+        carve_tunnel(floor, (x_pos, y_pos),
+                     (target_x, int(run_y[nearest])), rng.randint(0, 1) == 1)
+
+
+def cave_areas(width, height, room_min_size, room_max_size, rng):
+    """ Caves, and square areas of them to place entities in
+
+    The areas stand in for rooms: each is centred on a floor tile of the
+    caves, with the size of the largest room. There is one per twice the
+    tiles of a room, so their number grows with the map's area.
+
+    Returns the floor and the areas, at least one. Raises ValueError when
+    the caves leave no floor at all.
+
+    """
+
+    # RandomState rather than the newer Generator, for the numpy the
+    # Pipfile locks
+    noise = np.random.RandomState(rng.getrandbits(32))
+
+    floor = cave_floor(width, height, noise)
+    connect_regions(floor, rng)
+
+    # Areas must fit on the map, so their centres are kept off its edges
+    reach = room_max_size // 2
+    centres = floor.copy(order="F")
+    centres[:reach, :] = False
+    centres[width - reach:, :] = False
+    centres[:, :reach] = False
+    centres[:, height - reach:] = False
+
+    xs, ys = np.nonzero(centres)
+    if not len(xs):
+        # Too small a map for a whole area: any floor tile will do, with its
+        # area shrunk to fit on the map
+        xs, ys = np.nonzero(floor)
+    if not len(xs):
+        raise ValueError(f"No cave floor on a {width}x{height} map")
+
+    count = max(2, int(floor.sum()) // (2 * room_max_size * room_max_size))
+    picks = noise.randint(len(xs), size=count)
+
+    areas = []
+    for x_pos, y_pos in zip(xs[picks].tolist(), ys[picks].tolist()):
+        size = min(reach, x_pos, width - 1 - x_pos, y_pos, height - 1 - y_pos)
+        areas.append(Rect(x_pos - size, y_pos - size, 2 * size, 2 * size))
+
+    return floor, areas
+
+
+# generator name -> function(width, height, room_min_size, room_max_size, rng)
+# returning the floor and its rooms, the first for the player to arrive in
+# and the last for the stairs down
+GENERATORS = {
+    "bsp": bsp_rooms,
+    "caves": cave_areas,
+}
@@ -0,0 +1,93 @@
+""" Entity Index:
+
+- spatial hash of the entities on a floor, keyed by (x, y)
+
+"""
+
+
+class EntityIndex:
+    """ Entities bucketed by position, for O(1) position queries
+
+    Buckets keep the order entities were added in, and empty buckets are
+    dropped so the index only grows with the number of occupied tiles.
+
+    """
+
+    def __init__(self):
+        self.cells = {}
+
+    def __len__(self):
+        return sum(len(cell) for cell in self.cells.values())
+
+    def __iter__(self):
+        for cell in self.cells.values():
+            yield from cell
+
+    def add(self, entity, x_pos=None, y_pos=None):
+        """ Add an entity at its current position (when already known, pass it)
+
+        """
+
+        if x_pos is None:
+            x_pos, y_pos = entity.x_pos, entity.y_pos
+
+        self.cells.setdefault((x_pos, y_pos), []).append(entity)
+
+    def remove(self, entity, x_pos=None, y_pos=None):
+        """ Remove an entity from its position (or from a given position)
+
+        """
+
+        if x_pos is None:
+            x_pos, y_pos = entity.x_pos, entity.y_pos
+
+        cell = self.cells.get((x_pos, y_pos))
+
+        if cell is None or entity not in cell:
+            return False
+
+        cell.remove(entity)
+
+        if not cell:
+            del self.cells[(x_pos, y_pos)]
+
+        return True
+
+    def move(self, entity, old_x_pos, old_y_pos):
+        """ Move an entity's bucket after its position changed
+
+        """
+
+        if self.remove(entity, old_x_pos, old_y_pos):
+            self.add(entity)
+
+    def at(self, x_pos, y_pos):
+        """ All entities at a coordinate
+
+        """
+
+        return tuple(self.cells.get((x_pos, y_pos), ()))
+
+    def in_cells(self, xs, ys):
+        """ The entities at many coordinates, cell by cell
+
+        """
+
+        cells = self.cells
+
+        for coordinate in zip(xs, ys):
+            cell = cells.get(coordinate)
+
+            if cell:
+                yield from cell
+
+    def blocking_at(self, x_pos, y_pos):
+        """ The blocking entity at a coordinate, if any
+
+        """
+
+        for entity in self.cells.get((x_pos, y_pos), ()):
+            if entity.blocks:
+                return entity
+
+        return None
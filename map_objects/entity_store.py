@@ -0,0 +1,259 @@
+""" Entity Store:
+
+- entity data as parallel NumPy columns, one row per entity
+- bulk queries over a floor's entities as array masks
+
+"""
+
+import numpy as np
+
+# Column name -> (dtype, shape of one row's value)
+COLUMNS = {
+    "x": (np.int32, ()),
+    "y": (np.int32, ()),
+    "char": (np.uint32, ()),
+    "color": (np.uint8, (3, )),
+    "render_order": (np.int8, ()),
+    "blocks": (np.bool_, ()),
+    "has_ai": (np.bool_, ()),
+    "has_fighter": (np.bool_, ()),
+    "has_stairs": (np.bool_, ()),
+    "max_hp": (np.int32, ()),
+    "hp": (np.int32, ()),
+    "defense": (np.int32, ()),
+    "power": (np.int32, ()),
+    "xp": (np.int32, ()),
+}
+
+# Columns describing the entity, copied along when it changes store
+DATA_COLUMNS = tuple(COLUMNS)
+
+
+class EntityStore:
+    """ Struct-of-arrays storage of the entities of a floor
+
+    Every entity owns one row, and its `Entity` object is only a handle onto
+    that row. Rows are handed out in the order entities join the store, and
+    queries return entities in that same order - which is also the order of
+    the floor's entity list - so bulk queries give the same results as a
+    loop over the list.
+
+    Entities not on any floor (being created, carried or loaded) live in the
+    shared UNPLACED store, which does not hold on to them. Rows are only
+    given back when an entity moves to another store or is discarded.
+
+    """
+
+    def __init__(self, capacity=64, keep_handles=True):
+        self.capacity = capacity
+        # Rows in use are below `size`; released rows are reused first
+        self.size = 0
+        self.free = []
+        self.keep_handles = keep_handles
+        self.handles = [None] * capacity if keep_handles else None
+        self.next_sequence = 0
+
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.sequence = np.zeros(capacity, dtype=np.int64)
+
+        for name, (dtype, shape) in COLUMNS.items():
+            setattr(self, name, np.zeros((capacity, ) + shape, dtype=dtype))
+
+    def __len__(self):
+        return self.size - len(self.free)
+
+    def grow(self):
+        """ Double the capacity of every column
+
+        """
+
+        capacity = self.capacity * 2
+
+        for name in ("alive", "sequence") + DATA_COLUMNS:
+            column = getattr(self, name)
+            grown = np.zeros((capacity, ) + column.shape[1:],
+                             dtype=column.dtype)
+            grown[:self.capacity] = column
+            setattr(self, name, grown)
+
+        if self.keep_handles:
+            self.handles.extend([None] * (capacity - self.capacity))
+
+        self.capacity = capacity
+
+    def allocate(self, entity):
+        """ A fresh row for an entity
+
+        """
+
+        if self.free:
+            row = self.free.pop()
+        else:
+            if self.size == self.capacity:
+                self.grow()
+            row = self.size
+            self.size += 1
+
+        self.alive[row] = True
+        self.sequence[row] = self.next_sequence
+        self.next_sequence += 1
+
+        if self.keep_handles:
+            self.handles[row] = entity
+
+        return row
+
+    def allocate_many(self, entities):
+        """ Fresh rows for several entities, in order
+
+        """
+
+        count = len(entities)
+
+        reused = self.free[len(self.free) - count:][::-1] if count else []
+        del self.free[len(self.free) - len(reused):]
+
+        fresh = count - len(reused)
+        while self.size + fresh > self.capacity:
+            self.grow()
+
+        rows = np.array(reused + list(range(self.size, self.size + fresh)),
+                        dtype=np.intp)
+        self.size += fresh
+
+        self.alive[rows] = True
+        self.sequence[rows] = np.arange(self.next_sequence,
+                                        self.next_sequence + count)
+        self.next_sequence += count
+
+        if self.keep_handles:
+            handles = self.handles
+            for entity, row in zip(entities, rows.tolist()):
+                handles[row] = entity
+
+        return rows
+
+    def release(self, row):
+        """ Give a row back, once its entity left the store
+
+        """
+
+        self.alive[row] = False
+        self.has_ai[row] = False
+        self.has_fighter[row] = False
+        self.has_stairs[row] = False
+
+        if self.keep_handles:
+            self.handles[row] = None
+
+        self.free.append(row)
+
+    def release_many(self, rows):
+        """ Give several rows back at once
+
+        """
+
+        self.alive[rows] = False
+        self.has_ai[rows] = False
+        self.has_fighter[rows] = False
+        self.has_stairs[rows] = False
+
+        rows = rows.tolist()
+
+        if self.keep_handles:
+            handles = self.handles
+            for row in rows:
+                handles[row] = None
+
+        self.free.extend(rows)
+
+    def copy_row(self, row, other, other_row):
+        """ Copy an entity's data from a row (or an array of rows) of another
+        store
+
+        """
+
+        for name in DATA_COLUMNS:
+            getattr(self, name)[row] = getattr(other, name)[other_row]
+
+    def adopt(self, entities):
+        """ Move many entities into this store at once, keeping their order
+
+        """
+
+        entities = [entity for entity in entities if entity._store is not self]
+        rows = self.allocate_many(entities)
+
+        # Entities may come from several stores (e.g. a new floor's and the
+        # player's old one)
+        sources = {}
+        for index, entity in enumerate(entities):
+            sources.setdefault(entity._store, []).append(index)
+
+        for source, indices in sources.items():
+            source_rows = np.array([entities[index]._row for index in indices],
+                                   dtype=np.intp)
+
+            self.copy_row(rows[indices], source, source_rows)
+            source.release_many(source_rows)
+
+        for entity, row in zip(entities, rows.tolist()):
+            entity._store = self
+            entity._row = row
+
+    def select(self, mask):
+        """ The entities of the rows in a mask, in the order they joined
+
+        """
+
+        rows = np.flatnonzero(mask)
+        rows = rows[np.argsort(self.sequence[rows], kind="stable")]
+
+        handles = self.handles
+        return [handles[row] for row in rows.tolist()]
+
+    def live(self, column=None):
+        """ Mask of the rows in use (and with a flag column set)
+
+        """
+
+        mask = self.alive[:self.size].copy()
+
+        if column is not None:
+            mask = mask & getattr(self, column)[:self.size]
+
+        return mask
+
+    def within(self, x_pos, y_pos, radius, column=None):
+        """ Mask of the rows within a distance of a coordinate
+
+        """
+
+        d_x = self.x[:self.size] - x_pos
+        d_y = self.y[:self.size] - y_pos
+
+        return self.live(column) & (d_x * d_x + d_y * d_y <= radius * radius)
+
+    def within_square(self, x_pos, y_pos, radius, column=None):
+        """ Mask of the rows within a square of a given half-width
+
+        """
+
+        return (self.live(column)
+                & (np.abs(self.x[:self.size] - x_pos) <= radius)
+                & (np.abs(self.y[:self.size] - y_pos) <= radius))
+
+    def visible(self, fov, column=None):
+        """ Mask of the rows in a field of view (a [y, x] boolean array)
+
+        """
+
+        mask = self.live(column)
+        rows = np.flatnonzero(mask)
+        mask[rows] = fov[self.y[rows], self.x[rows]]
+
+        return mask
+
+
+# Entities that are not on a floor
+UNPLACED = EntityStore(keep_handles=False)
@@ -0,0 +1,94 @@
+""" Floor Prefetcher:
+
+- build the next floor in a worker process while the current one is played
+- hand it over when the player takes the stairs
+
+"""
+
+import multiprocessing
+from concurrent.futures import (BrokenExecutor, CancelledError,
+                                ProcessPoolExecutor)
+
+from map_objects.game_map import generate_floor
+
+
+class FloorPrefetcher:
+    """ Generates floors ahead of time in a single worker process
+
+    A floor is requested by (dungeon level, seed) as soon as it is known, and
+    taken when it is needed. Taking a floor that was not requested, or whose
+    worker failed, builds it on the spot instead - from the same seed, so the
+    floor is the same either way.
+
+    """
+
+    def __init__(self):
+        self.executor = None
+        self.key = None
+        self.future = None
+
+    def request(self, dungeon_level, constants, seed):
+        """ Start building a floor in the background
+
+        """
+
+        if self.executor is None:
+            # A fresh interpreter, rather than a fork of the windowed game
+            self.executor = ProcessPoolExecutor(
+                max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+
+        if self.future is not None:
+            self.future.cancel()
+
+        self.key = (dungeon_level, seed)
+
+        try:
+            self.future = self.executor.submit(generate_floor, dungeon_level,
+                                               constants, seed)
+        except BrokenExecutor:
+            # The worker is gone: take() builds this floor on the spot, and
+            # the next request starts a fresh worker
+            self.executor.shutdown(wait=False)
+            self.executor = None
+            self.future = None
+
+    def take(self, dungeon_level, constants, seed):
+        """ The floor for a level and seed, waiting for it if still building
+
+        """
+
+        future = self.future
+        key = self.key
+
+        self.future = None
+        self.key = None
+
+        if future is not None and key == (dungeon_level, seed):
+            try:
+                return future.result()
+            except (BrokenExecutor, CancelledError):
+                # The worker is gone, but the floor can still be built here
+                pass
+
+        return generate_floor(dungeon_level, constants, seed)
+
+    def close(self):
+        """ Stop the worker process
+
+        """
+
+        if self.future is not None:
+            self.future.cancel()
+
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+        self.future = None
+        self.key = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
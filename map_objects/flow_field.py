@@ -0,0 +1,112 @@
+""" Flow Field:
+
+- distance field rooted at a single goal (the player)
+- step down the field towards the goal
+
+"""
+
+import tcod
+
+# The eight neighbouring offsets, straight moves first
+NEIGHBOURS = ((0, -1), (0, 1), (-1, 0), (1, 0), (-1, -1), (1, -1), (-1, 1),
+              (1, 1))
+
+
+class FlowField:
+    """ Dijkstra distances to a goal, shared by every monster chasing it
+
+    The field only covers the tiles within `radius` of the goal, and only
+    walls are obstacles, so it stays valid while monsters move around during
+    the enemy turn. It is recomputed when the goal moves or a tile changes.
+
+    """
+
+    def __init__(self, radius):
+        self.radius = radius
+        self.root = None
+        self.x_1 = 0
+        self.y_1 = 0
+        self.window = None
+        self.dijkstra = None
+
+    def __getstate__(self):
+        # The tcod map and dijkstra are rebuilt on the next update
+        return {"radius": self.radius}
+
+    def __setstate__(self, state):
+        self.__init__(state["radius"])
+
+    def invalidate(self):
+        """ Forget the field, so the next update recomputes it
+
+        """
+
+        self.root = None
+
+    def update(self, game_map, x_pos, y_pos):
+        """ Root the field at a coordinate, unless it is already there
+
+        """
+
+        if self.root == (x_pos, y_pos):
+            return
+
+        self.x_1 = max(0, x_pos - self.radius)
+        self.y_1 = max(0, y_pos - self.radius)
+        x_2 = min(game_map.width, x_pos + self.radius + 1)
+        y_2 = min(game_map.height, y_pos + self.radius + 1)
+
+        self.window = tcod.map.Map(x_2 - self.x_1, y_2 - self.y_1, order="F")
+        self.window.walkable[...] = ~game_map.blocked[self.x_1:x_2,
+                                                      self.y_1:y_2]
+
+        # The 1.41 is the normal diagonal cost of moving
+        self.dijkstra = tcod.dijkstra_new(self.window, 1.41)
+        tcod.dijkstra_compute(self.dijkstra, x_pos - self.x_1,
+                              y_pos - self.y_1)
+
+        self.root = (x_pos, y_pos)
+
+    def distance(self, x_pos, y_pos):
+        """ Path distance from a coordinate to the root (None if unreachable)
+
+        """
+
+        x_pos -= self.x_1
+        y_pos -= self.y_1
+
+        if not (0 <= x_pos < self.window.width
+                and 0 <= y_pos < self.window.height):
+            return None
+
+        distance = tcod.dijkstra_get_distance(self.dijkstra, x_pos, y_pos)
+
+        if distance < 0 or distance >= self.radius:
+            return None
+
+        return distance
+
+    def next_step(self, x_pos, y_pos, walkable):
+        """ The free neighbouring coordinate closest to the root, if any
+
+        """
+
+        best_distance = self.distance(x_pos, y_pos)
+
+        if best_distance is None:
+            return None
+
+        best_step = None
+
+        for d_x, d_y in NEIGHBOURS:
+            step = (x_pos + d_x, y_pos + d_y)
+            distance = self.distance(*step)
+
+            if distance is None or not walkable[step]:
+                continue
+
+            if distance < best_distance:
+                best_distance = distance
+                best_step = step
+
+        return best_step
@@ -7,8 +7,10 @@
 - place entities on game map
 
 """
-from random import randint
+import random
+from collections import namedtuple
 
+import numpy as np
 import tcod
 
 from components.ai import BasicMonster
@@ -16,33 +18,281 @@ from components.fighter import Fighter
 from components.item import Item
 from components.stairs import Stairs
 from entity import Entity
+from fov_functions import FovCache, initialize_fov
 from game_messages import Message
 from item_functions import cast_confuse, cast_fireball, cast_lightning, heal
+from map_objects.dungeon_generators import GENERATORS
+from map_objects.entity_index import EntityIndex
+from map_objects.entity_store import UNPLACED, EntityStore
+from map_objects.flow_field import FlowField
 from map_objects.rectangle import Rect
-from map_objects.tile import Tile
-from render_functions import RenderOrder
+from map_objects.tile import TileGrid
+from render_functions import DirtyTracker, RenderOrder
+
+# A floor generated away from the game: the map, the entities on it (without
+# the player) and where the player arrives
+Floor = namedtuple("Floor", ["game_map", "entities", "player_x", "player_y"])
 
 
 class GameMap:
-    """ Creates a game map (contains Tile objects)
+    """ Creates a game map
+
+    Tiles are stored as boolean layers (`blocked`, `block_sight`, `explored`)
+    indexed `[x, y]`. The layers are Fortran-ordered, so `layer.T` is a
+    contiguous `[y, x]` array matching the tcod map and console buffers.
 
     """
 
-    def __init__(self, width, height, dungeon_level=1):
+    def __init__(self, width, height, dungeon_level=1, flow_field_radius=25):
         self.width = width
         self.height = height
-        self.tiles = self.initialize_tiles()
+        self.flow_field = FlowField(flow_field_radius)
+        self.fov_map = None
+        self.initialize_tiles()
         self.dungeon_level = dungeon_level
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # The entity index, navigation and sight are rebuilt by
+        # attach_entities once the entities are loaded
+        state["entity_index"] = None
+        state["entity_store"] = None
+        state["fov_cache"] = None
+        state["fov_map"] = None
+        state["occupied"] = None
+        state["nav_map"] = None
+        state["nav_path"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.dirty = DirtyTracker()
+        self.entity_index = EntityIndex()
+        self.entity_store = EntityStore()
+        self.fov_cache = FovCache()
+        self.fov_map = None
+        self.occupied = None
+        self.nav_map = None
+        self.nav_path = None
+
+    @property
+    def tiles(self):
+        """ Tile-like `tiles[x][y]` view onto the tile layers
+
+        """
+
+        return TileGrid(self)
+
     def initialize_tiles(self):
-        """ Creates 2D array of tiles
+        """ Creates the tile layers, with every tile a wall
+
+        """
+
+        shape = (self.width, self.height)
+
+        self.blocked = np.ones(shape, dtype=bool, order="F")
+        self.block_sight = np.ones(shape, dtype=bool, order="F")
+        self.explored = np.zeros(shape, dtype=bool, order="F")
+
+        # Entities, navigation, fields of view and redraw tracking belong to
+        # the floor
+        self.dirty = DirtyTracker()
+        self.entity_index = EntityIndex()
+        self.entity_store = EntityStore()
+        self.fov_cache = FovCache()
+        self.occupied = None
+        self.nav_map = None
+        self.nav_path = None
+        self.flow_field.invalidate()
+
+    def add_entity(self, entity):
+        """ Put an entity on this floor
+
+        """
+
+        entity.game_map = self
+        entity.move_to_store(self.entity_store)
+
+        x_pos, y_pos = entity.x_pos, entity.y_pos
+
+        self.entity_index.add(entity, x_pos, y_pos)
+        self.dirty.mark(x_pos, y_pos)
+
+        if entity.blocks:
+            self.occupy(x_pos, y_pos, 1)
+
+    def remove_entity(self, entity):
+        """ Take an entity off this floor (e.g. when it is picked up)
 
         """
 
-        tiles = [[Tile(True) for y in range(self.height)]
-                 for x in range(self.width)]
+        self.entity_index.remove(entity)
+        self.dirty.mark(entity.x_pos, entity.y_pos)
 
-        return tiles
+        if entity.blocks:
+            self.occupy(entity.x_pos, entity.y_pos, -1)
+
+        entity.game_map = None
+        entity.move_to_store(UNPLACED)
+
+    def discard_entities(self, keep=()):
+        """ Take the entities off this floor for good, except those in `keep`
+
+        """
+
+        store = self.entity_store
+
+        for entity in store.select(store.live()):
+            if entity not in keep:
+                entity.discard()
+
+    def attach_entities(self, entities):
+        """ Put loaded entities on this floor and build its navigation map
+
+        """
+
+        # Moving every row in one go is much cheaper than one at a time
+        self.entity_store.adopt(entities)
+
+        for entity in entities:
+            self.add_entity(entity)
+
+        self.initialize_navigation()
+        self.initialize_fov_map()
+
+    def get_entities_at(self, x_pos, y_pos):
+        """ All entities at a coordinate
+
+        """
+
+        return self.entity_index.at(x_pos, y_pos)
+
+    def get_blocking_entity_at(self, x_pos, y_pos):
+        """ The blocking entity at a coordinate, if any
+
+        """
+
+        return self.entity_index.blocking_at(x_pos, y_pos)
+
+    def initialize_navigation(self):
+        """ Build the navigation map for this floor
+
+        The navigation map has walls and blocking entities set as unwalkable.
+        It is built once per floor, then kept up to date as tiles change and
+        blocking entities move or die.
+
+        """
+
+        self.occupied = np.zeros((self.width, self.height),
+                                 dtype=np.int8,
+                                 order="F")
+
+        store = self.entity_store
+        blocking = np.flatnonzero(store.live("blocks"))
+        np.add.at(self.occupied, (store.x[blocking], store.y[blocking]), 1)
+
+        # Indexed [x, y], like the tile layers
+        self.nav_map = tcod.map.Map(self.width, self.height, order="F")
+        self.nav_map.transparent[...] = ~self.block_sight
+        self.nav_map.walkable[...] = ~self.blocked & (self.occupied == 0)
+
+        # The 1.41 is the normal diagonal cost of moving, it can be set as 0.0 if diagonal moves are prohibited
+        self.nav_path = tcod.path_new_using_map(self.nav_map, 1.41)
+
+    def occupy(self, x_pos, y_pos, count):
+        """ Add (or with a negative count, remove) blocking entities at a tile
+
+        """
+
+        if self.nav_map is not None:
+            self.occupied[x_pos, y_pos] += count
+            self.refresh_navigation((x_pos, y_pos))
+
+    def refresh_navigation(self, area):
+        """ Update the navigation map for an area (an index or slices)
+
+        """
+
+        if self.nav_map is None:
+            return
+
+        self.nav_map.transparent[area] = ~self.block_sight[area]
+        self.nav_map.walkable[area] = ~self.blocked[area] & (
+            self.occupied[area] == 0)
+
+    def initialize_fov_map(self):
+        """ Build the field of view map for this floor
+
+        The map is kept from floor to floor (it is reset in place when the
+        size matches), then kept up to date as tiles change.
+
+        """
+
+        fov_map = self.fov_map
+
+        if fov_map is None or (fov_map.width, fov_map.height) != (self.width,
+                                                                  self.height):
+            self.fov_map = initialize_fov(self)
+        else:
+            fov_map.fov[...] = False
+            self.refresh_fov_map(...)
+
+    def refresh_fov_map(self, area):
+        """ Update the field of view map for an area (an index or slices)
+
+        """
+
+        if self.fov_map is None:
+            return
+
+        # The fov map is indexed [y, x], the tile layers [x, y]
+        self.fov_map.transparent.T[area] = ~self.block_sight[area]
+        self.fov_map.walkable.T[area] = ~self.blocked[area]
+
+    def tiles_changed(self, area):
+        """ Bring navigation and sight up to date after tiles in an area were
+        changed
+
+        """
+
+        self.refresh_navigation(area)
+        self.refresh_fov_map(area)
+        self.flow_field.invalidate()
+        self.fov_cache.clear()
+
+    def set_tile(self, x_pos, y_pos, blocked, block_sight=None):
+        """ Change a single tile after the floor has been generated
+
+        """
+
+        # By default, if a tile is blocked, it also blocks sight
+        if block_sight is None:
+            block_sight = blocked
+
+        self.blocked[x_pos, y_pos] = blocked
+        self.block_sight[x_pos, y_pos] = block_sight
+        self.tiles_changed((x_pos, y_pos))
+
+    def entity_moved(self, entity, old_x_pos, old_y_pos):
+        """ Keep the entity index and navigation map up to date on a move
+
+        """
+
+        self.entity_index.move(entity, old_x_pos, old_y_pos)
+        self.dirty.mark(old_x_pos, old_y_pos)
+        self.dirty.mark(entity.x_pos, entity.y_pos)
+
+        if entity.blocks:
+            self.occupy(old_x_pos, old_y_pos, -1)
+            self.occupy(entity.x_pos, entity.y_pos, 1)
+
+    def entity_blocks_changed(self, entity):
+        """ Add or remove an entity's footprint (e.g. when it dies)
+
+        """
+
+        self.occupy(entity.x_pos, entity.y_pos, 1 if entity.blocks else -1)
+        self.dirty.mark(entity.x_pos, entity.y_pos)
 
     def make_map(
             self,
@@ -55,41 +305,86 @@ class GameMap:
             entities,
             max_monsters_per_room,
             max_items_per_room,
+            rng=random,
+            generator="rooms",
     ):
         """ Given max num of rooms: create them + connect with tunnels
 
+        Random numbers come from `rng` (a `random.Random`, or the module's
+        shared generator by default), so a seeded generator always builds
+        the same floor.
+
+        `generator` picks the layout: "rooms" (up to `max_rooms` random
+        rooms), or one of the tile-array generators, "bsp" or "caves" (see
+        dungeon_generators), whose room count grows with the map's area.
+
+        """
+
+        for entity in entities:
+            self.add_entity(entity)
+
+        if generator == "rooms":
+            rooms = self.make_rooms(max_rooms, room_min_size, room_max_size,
+                                    map_width, map_height, player, entities,
+                                    max_monsters_per_room, max_items_per_room,
+                                    rng)
+        else:
+            rooms = self.make_layout(generator, room_min_size, room_max_size,
+                                     player, entities, max_monsters_per_room,
+                                     max_items_per_room, rng)
+
+        (center_of_last_room_x, center_of_last_room_y) = rooms[-1].center()
+
+        stairs_component = Stairs(self.dungeon_level + 1)
+        down_stairs = Entity(
+            center_of_last_room_x,
+            center_of_last_room_y,
+            '>',
+            tcod.white,
+            'Stairs',
+            render_order=RenderOrder.STAIRS,
+            stairs=stairs_component)
+        entities.append(down_stairs)
+        self.add_entity(down_stairs)
+
+        self.initialize_navigation()
+        self.initialize_fov_map()
+
+    def make_rooms(self, max_rooms, room_min_size, room_max_size, map_width,
+                   map_height, player, entities, max_monsters_per_room,
+                   max_items_per_room, rng):
+        """ Lay out random rooms joined by tunnels, returning the rooms
+
         """
 
         rooms = []
         num_rooms = 0
 
-        center_of_last_room_x = None
-        center_of_last_room_y = None
+        # Tiles covered by a room or its walls: a new room intersects
+        # another exactly when its rectangle covers one of them
+        claimed = np.zeros((map_width, map_height), dtype=bool)
 
         for _ in range(max_rooms):
             # random width and height
-            width = randint(room_min_size, room_max_size)
-            height = randint(room_min_size, room_max_size)
+            width = rng.randint(room_min_size, room_max_size)
+            height = rng.randint(room_min_size, room_max_size)
             # random position without going out of the bounds of the map
-            x_pos = randint(0, map_width - width - 1)
-            y_pos = randint(0, map_height - height - 1)
+            x_pos = rng.randint(0, map_width - width - 1)
+            y_pos = rng.randint(0, map_height - height - 1)
 
             new_room = Rect(x_pos, y_pos, width, height)
+            footprint = (slice(new_room.x_1, new_room.x_2 + 1),
+                         slice(new_room.y_1, new_room.y_2 + 1))
 
-            # run through other rooms to see if they intersect with this one
-            for other_room in rooms:
-                if new_room.intersect(other_room):
-                    break
-            else:
+            # check the new room against the other rooms all at once
+            if not claimed[footprint].any():
                 # valid room
+                claimed[footprint] = True
                 self.create_room(new_room)
 
                 # center the coordinates of the new room
                 (new_x, new_y) = new_room.center()
 
-                center_of_last_room_x = new_x
-                center_of_last_room_y = new_y
-
                 if num_rooms == 0:
                     # this is the first room, where the player starts
                     player.x_pos = new_x
@@ -99,7 +394,7 @@ class GameMap:
                     (prev_x, prev_y) = rooms[num_rooms - 1].center()
 
                     # flip a coin
-                    if randint(0, 1) == 1:
+                    if rng.randint(0, 1) == 1:
                         # move horizontally, then vertically
                         self.create_horizontal_tunnel(prev_x, new_x, prev_y)
                         self.create_vertical_tunnel(prev_y, new_y, new_x)
@@ -110,69 +405,97 @@ class GameMap:
 
                 # add monsters
                 self.place_entities(new_room, entities, max_monsters_per_room,
-                                    max_items_per_room)
+                                    max_items_per_room, rng)
 
                 # append new room to the list
                 rooms.append(new_room)
                 num_rooms += 1
 
-        stairs_component = Stairs(self.dungeon_level + 1)
-        down_stairs = Entity(
-            center_of_last_room_x,
-            center_of_last_room_y,
-            '>',
-            tcod.white,
-            'Stairs',
-            RenderOrder.STAIRS,
-            stairs=stairs_component)
-        entities.append(down_stairs)
+        return rooms
+
+    def make_layout(self, generator, room_min_size, room_max_size, player,
+                    entities, max_monsters_per_room, max_items_per_room, rng):
+        """ Lay out the floor with a tile-array generator, returning its rooms
+
+        """
+
+        try:
+            layout = GENERATORS[generator]
+        except KeyError:
+            raise ValueError(f"Unknown map generator {generator!r}") from None
+
+        floor, rooms = layout(self.width, self.height, room_min_size,
+                              room_max_size, rng)
+
+        self.blocked[...] = ~floor
+        self.block_sight[...] = ~floor
+        self.tiles_changed(...)
+
+        # the first room is where the player starts
+        player.place(*rooms[0].center())
+
+        for room in rooms:
+            self.place_entities(room, entities, max_monsters_per_room,
+                                max_items_per_room, rng)
+
+        return rooms
 
     def create_room(self, room):
-        """ Iterate over tiles in a rectangle, make passable
+        """ Make the tiles inside a rectangle passable
 
         """
 
-        for x_pos in range(room.x_1 + 1, room.x_2):
-            for y_pos in range(room.y_1 + 1, room.y_2):
-                self.tiles[x_pos][y_pos].blocked = False
-                self.tiles[x_pos][y_pos].block_sight = False
+        inner = (slice(room.x_1 + 1, room.x_2), slice(room.y_1 + 1, room.y_2))
+
+        self.blocked[inner] = False
+        self.block_sight[inner] = False
+        self.tiles_changed(inner)
 
     def create_horizontal_tunnel(self, prev_x, new_x, y_pos):
         """ Creates an x-axis tunnel given a prev_x, new_x, and y position
 
         """
 
-        for x_pos in range(min(prev_x, new_x), max(prev_x, new_x) + 1):
-            self.tiles[x_pos][y_pos].blocked = False
-            self.tiles[x_pos][y_pos].block_sight = False
+        tunnel = (slice(min(prev_x, new_x), max(prev_x, new_x) + 1), y_pos)
+
+        self.blocked[tunnel] = False
+        self.block_sight[tunnel] = False
+        self.tiles_changed(tunnel)
 
     def create_vertical_tunnel(self, prev_y, new_y, x_pos):
         """ Creates an y-axis tunnel given a prev_y, new_y, and x position
 
         """
 
-        for y_pos in range(min(prev_y, new_y), max(prev_y, new_y) + 1):
-            self.tiles[x_pos][y_pos].blocked = False
-            self.tiles[x_pos][y_pos].block_sight = False
+        tunnel = (x_pos, slice(min(prev_y, new_y), max(prev_y, new_y) + 1))
 
-    def place_entities(self, room, entities, max_monsters_per_room,
-                       max_items_per_room):
+        self.blocked[tunnel] = False
+        self.block_sight[tunnel] = False
+        self.tiles_changed(tunnel)
+
+    def place_entities(self,
+                       room,
+                       entities,
+                       max_monsters_per_room,
+                       max_items_per_room,
+                       rng=random):
         """ Places a random number of monsters in a room
 
+        Spots that land on a wall (cave areas are not all floor) or on
+        another entity are skipped.
+
         """
 
-        number_of_monsters = randint(0, max_monsters_per_room)
-        number_of_items = randint(0, max_items_per_room)
+        number_of_monsters = rng.randint(0, max_monsters_per_room)
+        number_of_items = rng.randint(0, max_items_per_room)
 
         for _ in range(number_of_monsters):
-            x_pos = randint(room.x_1 + 1, room.x_2 - 1)
-            y_pos = randint(room.y_1 + 1, room.y_2 - 1)
-
-            if not any([
-                    entity for entity in entities
-                    if entity.x_pos == x_pos and entity.y_pos == y_pos
-            ]):
-                if randint(0, 100) < 80:
+            x_pos = rng.randint(room.x_1 + 1, room.x_2 - 1)
+            y_pos = rng.randint(room.y_1 + 1, room.y_2 - 1)
+
+            if not (self.blocked[x_pos, y_pos]
+                    or self.get_entities_at(x_pos, y_pos)):
+                if rng.randint(0, 100) < 80:
                     fighter_component = Fighter(
                         hp=10, defense=0, power=3, xp=35)
                     ai_component = BasicMonster()
@@ -206,15 +529,14 @@ class GameMap:
                     )
 
                 entities.append(monster)
+                self.add_entity(monster)
         for _ in range(number_of_items):
-            x_pos = randint(room.x_1 + 1, room.x_2 - 1)
-            y_pos = randint(room.y_1 + 1, room.y_2 - 1)
+            x_pos = rng.randint(room.x_1 + 1, room.x_2 - 1)
+            y_pos = rng.randint(room.y_1 + 1, room.y_2 - 1)
 
-            if not any([
-                    entity for entity in entities
-                    if entity.x_pos == x_pos and entity.y_pos == y_pos
-            ]):
-                item_chance = randint(0, 100)
+            if not (self.blocked[x_pos, y_pos]
+                    or self.get_entities_at(x_pos, y_pos)):
+                item_chance = rng.randint(0, 100)
 
                 if item_chance < 70:
                     item_component = Item(use_function=heal, amount=4)
@@ -277,31 +599,34 @@ class GameMap:
                         item=item_component,
                     )
                 entities.append(item)
+                self.add_entity(item)
 
     def is_blocked(self, x_pos, y_pos):
         """ Check if coordinate is blocked
 
         """
 
-        if self.tiles[x_pos][y_pos].blocked:
-            return True
-
-        return False
+        return bool(self.blocked[x_pos, y_pos])
 
-    def next_floor(self, player, message_log, constants):
-        """ Go down a floor level
+    def next_floor(self, player, message_log, floor):
+        """ Go down a floor level, onto a floor from `generate_floor`
 
         """
 
-        self.dungeon_level += 1
-        entities = [player]
+        self.dungeon_level = floor.game_map.dungeon_level
 
-        self.tiles = self.initialize_tiles()
-        self.make_map(constants['max_rooms'], constants['room_min_size'],
-                      constants['room_max_size'], constants['map_width'],
-                      constants['map_height'], player, entities,
-                      constants['max_monsters_per_room'],
-                      constants['max_items_per_room'])
+        # The old floor is left behind, with everything on it but the player
+        self.discard_entities(keep=(player, ))
+        self.initialize_tiles()
+        self.blocked[...] = floor.game_map.blocked
+        self.block_sight[...] = floor.game_map.block_sight
+        self.explored[...] = floor.game_map.explored
+
+        # The player is still indexed on the old floor, so place it first
+        player.place(floor.player_x, floor.player_y)
+
+        entities = [player] + floor.entities
+        self.attach_entities(entities)
 
         player.fighter.heal(player.fighter.max_hp // 2)
 
@@ -310,3 +635,37 @@ class GameMap:
                     tcod.light_violet))
 
         return entities
+
+
+def generate_floor(dungeon_level, constants, seed):
+    """ Build a floor on its own, from a seed
+
+    The floor does not touch the game in progress, so it can be built ahead
+    of time (e.g. in another process, see FloorPrefetcher). A seed always
+    builds the same floor.
+
+    """
+
+    game_map = GameMap(constants['map_width'],
+                       constants['map_height'],
+                       dungeon_level,
+                       flow_field_radius=constants['flow_field_radius'])
+
+    # Stands in for the player while the rooms are laid out. It starts inside
+    # a wall, and is moved to the first room before anything is placed.
+    arrival = Entity(0, 0, '@', tcod.white, 'Player', blocks=True)
+    entities = [arrival]
+
+    game_map.make_map(constants['max_rooms'], constants['room_min_size'],
+                      constants['room_max_size'], constants['map_width'],
+                      constants['map_height'], arrival, entities,
+                      constants['max_monsters_per_room'],
+                      constants['max_items_per_room'], random.Random(seed),
+                      constants['map_generator'])
+
+    # The stand-in is done with once it shows where the player arrives
+    arrival_x, arrival_y = arrival.x_pos, arrival.y_pos
+    game_map.remove_entity(arrival)
+    arrival.discard()
+
+    return Floor(game_map, entities[1:], arrival_x, arrival_y)
@@ -10,6 +10,8 @@ class Rect:
 
     """
 
+    __slots__ = ("x_1", "y_1", "x_2", "y_2")
+
     def __init__(self, x_pos, y_pos, width, height):
         self.x_1 = x_pos
         self.y_1 = y_pos
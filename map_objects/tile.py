@@ -1,6 +1,7 @@
 """ Tile
 
 - creates tile object
+- tile-like views onto a GameMap's tile layers
 
 """
 
@@ -21,3 +22,87 @@ class Tile:
 
         self.block_sight = block_sight
         self.explored = False
+
+
+class TileView:
+    """ A single cell of a GameMap, read and written through its tile layers
+
+    Behaves like a Tile, so code written against `tiles[x][y]` keeps working.
+
+    """
+
+    def __init__(self, game_map, x_pos, y_pos):
+        self.game_map = game_map
+        self.x_pos = x_pos
+        self.y_pos = y_pos
+
+    @property
+    def blocked(self):
+        return bool(self.game_map.blocked[self.x_pos, self.y_pos])
+
+    @blocked.setter
+    def blocked(self, value):
+        self.game_map.blocked[self.x_pos, self.y_pos] = value
+        self.game_map.tiles_changed((self.x_pos, self.y_pos))
+
+    @property
+    def block_sight(self):
+        return bool(self.game_map.block_sight[self.x_pos, self.y_pos])
+
+    @block_sight.setter
+    def block_sight(self, value):
+        self.game_map.block_sight[self.x_pos, self.y_pos] = value
+        self.game_map.tiles_changed((self.x_pos, self.y_pos))
+
+    @property
+    def explored(self):
+        return bool(self.game_map.explored[self.x_pos, self.y_pos])
+
+    @explored.setter
+    def explored(self, value):
+        self.game_map.explored[self.x_pos, self.y_pos] = value
+
+
+class TileColumn:
+    """ A column (fixed x) of TileViews, indexed by y
+
+    """
+
+    def __init__(self, game_map, x_pos):
+        self.game_map = game_map
+        self.x_pos = x_pos
+
+    def __len__(self):
+        return self.game_map.height
+
+    def __getitem__(self, y_pos):
+        return TileView(self.game_map, self.x_pos, y_pos)
+
+    def __iter__(self):
+        for y_pos in range(self.game_map.height):
+            yield self[y_pos]
+
+    def __setitem__(self, y_pos, tile):
+        view = self[y_pos]
+        view.blocked = tile.blocked
+        view.block_sight = tile.block_sight
+        view.explored = tile.explored
+
+
+class TileGrid:
+    """ Compatibility view of a GameMap's tile layers as `tiles[x][y]`
+
+    """
+
+    def __init__(self, game_map):
+        self.game_map = game_map
+
+    def __len__(self):
+        return self.game_map.width
+
+    def __getitem__(self, x_pos):
+        return TileColumn(self.game_map, x_pos)
+
+    def __iter__(self):
+        for x_pos in range(self.game_map.width):
+            yield self[x_pos]
@@ -0,0 +1,93 @@
+""" Monster Schedule:
+
+- track which monsters are awake and take turns
+- wake monsters that come into view or hear a noise
+- put monsters back to sleep once they stay out of view
+
+"""
+
+import numpy as np
+
+
+class MonsterSchedule:
+    """ The awake monsters of a floor, in the order they woke up
+
+    Only awake monsters are given turns, so dormant ones cost nothing. A
+    monster wakes when it is in the player's field of view or hears a noise,
+    and falls back asleep after `dormancy_turns` turns out of view. With
+    `follow_noise`, monsters are also told where a noise came from, so they
+    go and look for its source.
+
+    """
+
+    def __init__(self, dormancy_turns, follow_noise=False):
+        self.dormancy_turns = dormancy_turns
+        self.follow_noise = follow_noise
+        # Monster -> turns spent out of view since it was last seen
+        self.awake = {}
+
+    def __len__(self):
+        return len(self.awake)
+
+    def __iter__(self):
+        # A copy, so monsters can wake or fall asleep during a turn
+        return iter(list(self.awake))
+
+    def __contains__(self, entity):
+        return entity in self.awake
+
+    def wake(self, entity):
+        """ Give a monster turns again, resetting its time out of view
+
+        """
+
+        if entity.ai:
+            self.awake[entity] = 0
+
+    def wake_visible(self, fov_map, entity_store):
+        """ Wake every monster in the field of view
+
+        """
+
+        rows = np.flatnonzero(entity_store.visible(fov_map.fov, "has_ai"))
+
+        # Wake them row by row across the field of view
+        rows = rows[np.lexsort((entity_store.x[rows], entity_store.y[rows]))]
+
+        for row in rows.tolist():
+            self.wake(entity_store.handles[row])
+
+    def make_noise(self, entity_store, x_pos, y_pos, radius):
+        """ Wake the monsters within a radius
+
+        With `follow_noise`, they are also told where to look.
+
+        """
+
+        rows = np.flatnonzero(
+            entity_store.within_square(x_pos, y_pos, radius, "has_ai"))
+
+        # Wake them column by column across the square
+        rows = rows[np.lexsort((entity_store.y[rows], entity_store.x[rows]))]
+
+        for row in rows.tolist():
+            entity = entity_store.handles[row]
+            self.wake(entity)
+            if self.follow_noise:
+                entity.ai.hear(x_pos, y_pos)
+
+    def end_turn(self, fov_map):
+        """ Age the monsters out of view, and put the long unseen to sleep
+
+        """
+
+        for entity in list(self.awake):
+            if not entity.ai:
+                # Dead monsters never take another turn
+                del self.awake[entity]
+            elif fov_map.fov[entity.y_pos, entity.x_pos]:
+                self.awake[entity] = 0
+            elif self.awake[entity] >= self.dormancy_turns:
+                del self.awake[entity]
+            else:
+                self.awake[entity] += 1
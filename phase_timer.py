@@ -0,0 +1,193 @@
+""" Phase Timer:
+
+- time the phases of a turn and of a frame
+- rolling histograms of the latest timings of each phase
+- export the timings to a file
+
+"""
+
+import json
+import time
+from collections import deque
+
+# Histogram buckets are powers of two of microseconds: bucket b holds the
+# timings under 2 ** b us (the last one everything longer)
+BUCKETS = 24
+
+
+def bucket_of(duration):
+    """ The histogram bucket of a duration in nanoseconds
+
+    """
+
+    return min(BUCKETS - 1, (duration // 1000).bit_length())
+
+
+class Phase:
+    """ The latest timings of one phase, and their histogram
+
+    Used as a context manager to time a block. Phases are not re-entrant:
+    one phase cannot be timed inside itself.
+
+    """
+
+    __slots__ = ("samples", "histogram", "start")
+
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)
+        self.histogram = [0] * BUCKETS
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.add(time.perf_counter_ns() - self.start)
+
+    def add(self, duration):
+        """ Add a timing, in nanoseconds, dropping the oldest once full
+
+        """
+
+        samples = self.samples
+
+        if len(samples) == samples.maxlen:
+            self.histogram[bucket_of(samples[0])] -= 1
+
+        samples.append(duration)
+        self.histogram[bucket_of(duration)] += 1
+
+    def summary(self):
+        """ Count, mean, percentiles and maximum in microseconds, and the
+        histogram
+
+        """
+
+        samples = sorted(self.samples)
+        count = len(samples)
+
+        if not count:
+            return {"count": 0}
+
+        def percentile(fraction):
+            return samples[min(count - 1, int(count * fraction))] / 1000
+
+        return {
+            "count": count,
+            "mean_us": sum(samples) / count / 1000,
+            "p50_us": percentile(0.5),
+            "p95_us": percentile(0.95),
+            "max_us": samples[-1] / 1000,
+            "histogram": self.histogram[:],
+        }
+
+
+class PhaseTimer:
+    """ Rolling timings of named phases (e.g. "fov", "render.tiles")
+
+    Each phase keeps its latest `window` timings, so the numbers follow what
+    the game is doing now rather than averaging over the whole session.
+
+    Used as a context manager, the timings are exported to `path` (if any)
+    when leaving it.
+
+    """
+
+    # Whether timings are kept, so callers can skip measuring altogether
+    enabled = True
+
+    def __init__(self, window=500, path=None):
+        self.window = window
+        self.path = path
+        self.phases = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.path:
+            self.export(self.path)
+
+    def phase(self, name):
+        """ The phase of a name, to time a block with `with`
+
+        """
+
+        phase = self.phases.get(name)
+
+        if phase is None:
+            phase = self.phases[name] = Phase(self.window)
+
+        return phase
+
+    def add(self, name, duration):
+        """ Add a timing in nanoseconds measured elsewhere
+
+        """
+
+        self.phase(name).add(duration)
+
+    def summary(self):
+        """ Summary of every phase, by name
+
+        """
+
+        return {
+            name: phase.summary()
+            for name, phase in sorted(self.phases.items())
+        }
+
+    def export(self, path):
+        """ Write the summary to a JSON file
+
+        """
+
+        with open(path, "w") as timings_file:
+            json.dump(
+                {
+                    "window": self.window,
+                    "histogram_bounds_us": [2**b for b in range(BUCKETS)],
+                    "phases": self.summary(),
+                },
+                timings_file,
+                indent=2)
+
+
+class NullPhase:
+    """ A phase that times nothing
+
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def add(self, duration):
+        pass
+
+
+class NullTimer:
+    """ A timer that keeps nothing, for when timings are not wanted
+
+    """
+
+    enabled = False
+    phases = {}
+
+    def phase(self, name):
+        return NULL_PHASE
+
+    def add(self, name, duration):
+        pass
+
+    def summary(self):
+        return {}
+
+
+NULL_PHASE = NullPhase()
+NULL_TIMER = NullTimer()
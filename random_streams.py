@@ -0,0 +1,37 @@
+""" Random Streams:
+
+- one seeded random number generator per subsystem
+- a game seed decides every random choice of the game
+
+"""
+
+import random
+
+# The subsystems that draw random numbers
+STREAMS = ("map", "floors", "monsters")
+
+
+class RandomStreams:
+    """ Independent `random.Random` streams derived from a single game seed
+
+    Each subsystem draws from its own stream, so a change in how often one of
+    them draws (e.g. a new map feature) does not shift the numbers another
+    sees. The same seed always gives the same streams.
+
+    """
+
+    def __init__(self, seed):
+        self.seed = seed
+
+        for name in STREAMS:
+            # String seeds are hashed, so nearby game seeds still give
+            # unrelated streams
+            setattr(self, name, random.Random(f"{seed}:{name}"))
+
+
+def new_seed():
+    """ A fresh game seed
+
+    """
+
+    return random.getrandbits(32)
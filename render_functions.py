@@ -6,10 +6,17 @@
 
 from enum import Enum, auto
 
+import numpy as np
 import tcod
 
 from game_states import GameStates
 from menu import inventory_menu, level_up_menu
+from phase_timer import NULL_TIMER
+
+# The timings overlay: a phase name and three timings wide, and tall enough
+# for every phase
+TIMINGS_WIDTH = 48
+TIMINGS_HEIGHT = 20
 
 
 class RenderOrder(Enum):
@@ -23,7 +30,93 @@ class RenderOrder(Enum):
     ACTOR = auto()
 
 
-def get_names_under_mouse(mouse, entities, fov_map):
+class DirtyTracker:
+    """ Map cells and screen areas that changed since the last frame
+
+    Entity moves, deaths, pickups and drops mark their cells, and FOV changes
+    mark the tiles whose visibility flipped. render_all then only redraws
+    those cells and blits their bounding region. Anything that disturbs the
+    whole screen (a new floor, menus) marks everything instead.
+
+    """
+
+    def __init__(self):
+        self.cells = set()
+        self.bounds = None
+        self.full = True
+        self.visible = None
+        self.game_state = None
+        self.panel_state = None
+
+    def __getstate__(self):
+        # A loaded floor is always redrawn in full
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
+
+    def mark(self, x_pos, y_pos):
+        """ Mark a single map cell for redrawing
+
+        """
+
+        self.cells.add((x_pos, y_pos))
+        self.extend(x_pos, y_pos, x_pos + 1, y_pos + 1)
+
+    def mark_all(self):
+        """ Mark the whole screen for redrawing
+
+        """
+
+        self.full = True
+
+    def extend(self, x_1, y_1, x_2, y_2):
+        """ Grow the dirty region to cover a rectangle
+
+        """
+
+        if self.bounds:
+            (old_x_1, old_y_1, old_x_2, old_y_2) = self.bounds
+            x_1, y_1 = min(x_1, old_x_1), min(y_1, old_y_1)
+            x_2, y_2 = max(x_2, old_x_2), max(y_2, old_y_2)
+
+        self.bounds = (x_1, y_1, x_2, y_2)
+
+    def mark_visibility(self, visible, entity_index):
+        """ Mark the tiles (and entities) whose visibility changed
+
+        """
+
+        previous = self.visible
+        self.visible = visible.copy()
+
+        if self.full or previous is None or previous.shape != visible.shape:
+            self.full = True
+            return
+
+        y_changed, x_changed = np.nonzero(previous != visible)
+
+        if not len(x_changed):
+            return
+
+        self.extend(int(x_changed.min()), int(y_changed.min()),
+                    int(x_changed.max()) + 1, int(y_changed.max()) + 1)
+
+        for cell in zip(x_changed.tolist(), y_changed.tolist()):
+            if cell in entity_index.cells:
+                self.cells.add(cell)
+
+    def clear(self):
+        """ Forget all changes, once they have been drawn
+
+        """
+
+        self.cells.clear()
+        self.bounds = None
+        self.full = False
+
+
+def get_names_under_mouse(mouse, game_map, fov_map):
     """ Detect names of entities under mouse coordinate
 
     """
@@ -31,9 +124,8 @@ def get_names_under_mouse(mouse, entities, fov_map):
     (x, y) = (mouse.cx, mouse.cy)
 
     names = [
-        entity.name for entity in entities
-        if entity.x_pos == x and entity.y_pos == y
-        and tcod.map_is_in_fov(fov_map, entity.x_pos, entity.y_pos)
+        entity.name for entity in game_map.get_entities_at(x, y)
+        if tcod.map_is_in_fov(fov_map, entity.x_pos, entity.y_pos)
     ]
     names = ", ".join(names)
 
@@ -68,17 +160,49 @@ def render_bar(panel, x_pos, y_pos, total_width, name, value, maximum,
     )
 
 
-def draw_entity(console, entity, fov_map, game_map):
-    """ Draws an entity on the console
+def draw_entities(console, game_map, rows, visible):
+    """ Draws the entities of some rows of the floor's entity store
+
+    Entities in view are drawn, and stairs too once explored. The render
+    order column buckets the entities, and each bucket is drawn with a few
+    array writes, lowest first, so actors end up on top of items, corpses
+    and stairs. Within a bucket, the latest entity on a cell wins.
 
     """
 
-    if tcod.map_is_in_fov(fov_map, entity.x_pos, entity.y_pos) or (
-            entity.stairs
-            and game_map.tiles[entity.x_pos][entity.y_pos].explored):
-        tcod.console_set_default_foreground(console, entity.color)
-        tcod.console_put_char(console, entity.x_pos, entity.y_pos, entity.char,
-                              tcod.BKGND_NONE)
+    if not len(rows):
+        return
+
+    store = game_map.entity_store
+
+    xs = store.x[rows]
+    ys = store.y[rows]
+    shown = visible[ys, xs] | (store.has_stairs[rows]
+                               & game_map.explored[xs, ys])
+    rows = rows[shown]
+    orders = store.render_order[rows]
+
+    for render_order in RenderOrder:
+        bucket = rows[orders == render_order.value]
+
+        if not len(bucket):
+            continue
+
+        xs = store.x[bucket]
+        ys = store.y[bucket]
+
+        # Keep only the last entity to join the floor on each cell
+        cells = ys.astype(np.intp) * game_map.width + xs
+        order = np.lexsort((store.sequence[bucket], cells))
+        cells = cells[order]
+        last = np.ones(len(order), dtype=bool)
+        last[:-1] = cells[1:] != cells[:-1]
+        bucket = bucket[order[last]]
+
+        xs = store.x[bucket]
+        ys = store.y[bucket]
+        console.ch[ys, xs] = store.char[bucket]
+        console.fg[ys, xs] = store.color[bucket]
 
 
 def clear_entity(console, entity):
@@ -90,79 +214,33 @@ def clear_entity(console, entity):
                           tcod.BKGND_NONE)
 
 
-def render_all(
-        console,
-        panel,
-        entities,
-        player,
-        game_map,
-        fov_map,
-        fov_recompute,
-        message_log,
-        screen_width,
-        screen_height,
-        bar_width,
-        panel_height,
-        panel_y,
-        mouse,
-        colors,
-        game_state,
-):
-    """ Draw all entities
+def draw_tiles(console, game_map, fov_map, colors):
+    """ Colors the background of every map tile, and marks visible ones explored
+
+    Works on whole arrays at once: the tcod map and console buffers are
+    indexed [y, x], so the [x, y] tile layers are transposed to match.
 
     """
 
-    # Draw all tiles
-    if fov_recompute:
-        for y_pos in range(game_map.height):
-            for x_pos in range(game_map.width):
-                visible = tcod.map_is_in_fov(fov_map, x_pos, y_pos)
-                wall = game_map.tiles[x_pos][y_pos].block_sight
-
-                if visible:
-                    if wall:
-                        tcod.console_set_char_background(
-                            console,
-                            x_pos,
-                            y_pos,
-                            colors.get("light_wall"),
-                            tcod.BKGND_SET,
-                        )
-                    else:
-                        tcod.console_set_char_background(
-                            console,
-                            x_pos,
-                            y_pos,
-                            colors.get("light_ground"),
-                            tcod.BKGND_SET,
-                        )
-                    game_map.tiles[x_pos][y_pos].explored = True
-                elif game_map.tiles[x_pos][y_pos].explored:
-                    if wall:
-                        tcod.console_set_char_background(
-                            console,
-                            x_pos,
-                            y_pos,
-                            colors.get("dark_wall"),
-                            tcod.BKGND_SET,
-                        )
-                    else:
-                        tcod.console_set_char_background(
-                            console,
-                            x_pos,
-                            y_pos,
-                            colors.get("dark_ground"),
-                            tcod.BKGND_SET,
-                        )
-
-    # Draw all entities
-    entities_in_render_order = sorted(
-        entities, key=lambda x: x.render_order.value)
-
-    for entity in entities_in_render_order:
-        draw_entity(console, entity, fov_map, game_map)
-
-    tcod.console_blit(console, 0, 0, screen_width, screen_height, 0, 0, 0)
+    visible = fov_map.fov
+    wall = game_map.block_sight.T
+    explored = game_map.explored.T
+
+    explored |= visible
+    remembered = explored & ~visible
+
+    background = console.bg[:game_map.height, :game_map.width]
+    background[visible & wall] = colors.get("light_wall")
+    background[visible & ~wall] = colors.get("light_ground")
+    background[remembered & wall] = colors.get("dark_wall")
+    background[remembered & ~wall] = colors.get("dark_ground")
+
+
+def render_panel(panel, player, game_map, message_log, names_under_mouse,
+                 screen_width, bar_width, panel_height, panel_y):
+    """ Draw the status panel (messages, HP bar, level, names under mouse)
+
+    """
 
     tcod.console_set_default_background(panel, tcod.black)
     tcod.console_clear(panel)
@@ -196,29 +274,165 @@ def render_all(
         0,
         tcod.BKGND_NONE,
         tcod.LEFT,
-        get_names_under_mouse(mouse, entities, fov_map),
+        names_under_mouse,
     )
 
     tcod.console_blit(panel, 0, 0, screen_width, panel_height, 0, 0, panel_y)
 
-    if game_state in (GameStates.SHOW_INVENTORY, GameStates.DROP_INVENTORY):
-        if game_state == GameStates.SHOW_INVENTORY:
-            inventory_title = (
-                "Press the key next to an item to use it, or Esc to cancel\n")
+
+def render_timings(window, timer, screen_width, dirty):
+    """ Draw the timings overlay in the top right corner of the screen
+
+    Shows the mean, 95th percentile and maximum of every phase's latest
+    timings, in microseconds, on a console made once (TIMINGS_WIDTH by
+    TIMINGS_HEIGHT) and reused every frame.
+
+    """
+
+    lines = [f"{'phase (us)':<24}{'mean':>8}{'p95':>8}{'max':>8}"]
+
+    for name, summary in timer.summary().items():
+        if summary["count"]:
+            lines.append(f"{name:<24}{summary['mean_us']:8.0f}"
+                         f"{summary['p95_us']:8.0f}{summary['max_us']:8.0f}")
+
+    lines = lines[:TIMINGS_HEIGHT]
+    height = len(lines)
+    x_pos = screen_width - TIMINGS_WIDTH
+
+    tcod.console_set_default_foreground(window, tcod.white)
+    tcod.console_clear(window)
+
+    for y_pos, line in enumerate(lines):
+        tcod.console_print_ex(window, 0, y_pos, tcod.BKGND_NONE, tcod.LEFT,
+                              line)
+
+    tcod.console_blit(window, 0, 0, TIMINGS_WIDTH, height, 0, x_pos, 0, 1.0,
+                      0.7)
+
+    # The overlay is blended onto what is already on screen, so the map
+    # under it is blitted again next frame rather than darkened twice
+    dirty.extend(x_pos, 0, screen_width, height)
+
+
+def render_all(
+        console,
+        panel,
+        entities,
+        player,
+        game_map,
+        fov_map,
+        fov_recompute,
+        message_log,
+        screen_width,
+        screen_height,
+        bar_width,
+        panel_height,
+        panel_y,
+        mouse,
+        colors,
+        game_state,
+        timer=NULL_TIMER,
+):
+    """ Draw all entities
+
+    With a `timer` (a PhaseTimer), the tiles, entities, panel and menus are
+    timed.
+
+    """
+
+    dirty = game_map.dirty
+
+    # Menus are drawn straight onto the root console, so entering or leaving
+    # one needs the whole screen redrawn
+    if game_state != dirty.game_state:
+        dirty.game_state = game_state
+        dirty.mark_all()
+
+    # Draw all tiles
+    if fov_recompute:
+        with timer.phase("render.tiles"):
+            draw_tiles(console, game_map, fov_map, colors)
+            dirty.mark_visibility(fov_map.fov, game_map.entity_index)
+
+    with timer.phase("render.entities"):
+        # Erase and redraw the entities on dirty cells (or all of them)
+        clear_all(console, entities, dirty)
+
+        if dirty.full:
+            dirty_rows = np.flatnonzero(game_map.entity_store.live())
+        else:
+            dirty_rows = np.array([
+                entity._row for cell in dirty.cells
+                for entity in game_map.get_entities_at(*cell)
+            ], dtype=np.intp)
+
+        draw_entities(console, game_map, dirty_rows, fov_map.fov)
+
+        if dirty.full:
+            tcod.console_blit(console, 0, 0, screen_width, screen_height, 0,
+                              0, 0)
+        elif dirty.bounds:
+            (x_1, y_1, x_2, y_2) = dirty.bounds
+            tcod.console_blit(console, x_1, y_1, x_2 - x_1, y_2 - y_1, 0,
+                              x_1, y_1)
+
+    with timer.phase("render.panel"):
+        # Only redraw the panel when something shown on it changed
+        names_under_mouse = get_names_under_mouse(mouse, game_map, fov_map)
+        panel_state = (
+            tuple(message_log.messages),
+            player.fighter.hp,
+            player.fighter.max_hp,
+            game_map.dungeon_level,
+            names_under_mouse,
+        )
+
+        if dirty.full or panel_state != dirty.panel_state:
+            dirty.panel_state = panel_state
+
+            render_panel(panel, player, game_map, message_log,
+                         names_under_mouse, screen_width, bar_width,
+                         panel_height, panel_y)
+
+    dirty.clear()
+
+    with timer.phase("render.menus"):
+        if game_state in (GameStates.SHOW_INVENTORY,
+                          GameStates.DROP_INVENTORY):
+            if game_state == GameStates.SHOW_INVENTORY:
+                inventory_title = (
+                    "Press the key next to an item to use it, or Esc to cancel\n"
+                )
+            else:
+                inventory_title = (
+                    "Press the key next to an item to drop it, or Esc to cancel\n"
+                )
+            inventory_menu(console, inventory_title, player.inventory, 50,
+                           screen_width, screen_height)
+        elif game_state == GameStates.LEVEL_UP:
+            level_up_menu(console, 'Level up! Choose a stat to raise:',
+                          player, 40, screen_width, screen_height)
         else:
-            inventory_title = (
-                "Press the key next to an item to drop it, or Esc to cancel\n")
-        inventory_menu(console, inventory_title, player.inventory, 50,
-                       screen_width, screen_height)
-    elif game_state == GameStates.LEVEL_UP:
-        level_up_menu(console, 'Level up! Choose a stat to raise:', player, 40,
-                      screen_width, screen_height)
+            return
+
+        # Menus are blended onto what is already on screen, so the whole
+        # screen under them is drawn again next frame rather than darkened
+        # twice (they can cover the panel too)
+        dirty.mark_all()
 
 
-def clear_all(console, entities):
-    """ Clears all entities
+def clear_all(console, entities, dirty=None):
+    """ Clears all entities, or only the cells marked in a dirty tracker
 
     """
 
-    for entity in entities:
-        clear_entity(console, entity)
+    if dirty is None:
+        for entity in entities:
+            clear_entity(console, entity)
+    elif dirty.full:
+        # Entities may have moved since they were drawn, so erase everything
+        console.ch[...] = ord(" ")
+    else:
+        for (x_pos, y_pos) in dirty.cells:
+            tcod.console_put_char(console, x_pos, y_pos, " ", tcod.BKGND_NONE)
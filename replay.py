@@ -0,0 +1,282 @@
+""" Replay:
+
+- record the actions of a session to a compact file
+- replay a recording against the engine, as fast as possible
+
+A recording holds the game seed, the game state the session started from (in
+the save format) and every action the player took. Replaying it rebuilds the
+exact same session, which makes recorded sessions usable as benchmarks:
+
+    python replay.py session.rec [--render] [--repeat N]
+
+"""
+
+import argparse
+import struct
+import sys
+import time
+
+import tcod
+
+from exception_handlers import SaveFormatError
+from game_events import Exit
+from loader_functions.initialize_new_game import get_constants
+from loader_functions.save_format import (decode_game, encode_snapshot,
+                                          snapshot_game)
+from render_functions import render_all
+from simulation import Simulation
+
+MAGIC = b"PYRR"
+VERSION = 1
+
+# Action keys the engine handles itself, not the simulation
+FRONT_END_KEYS = ("fullscreen", "toggle_timings")
+
+# Flag actions are stored as a bit each; the rest carry a payload
+FLAG_KEYS = ("pickup", "show_inventory", "drop_inventory", "take_stairs",
+             "exit")
+MOVE = 1 << 5
+INVENTORY_INDEX = 1 << 6
+LEFT_CLICK = 1 << 7
+RIGHT_CLICK = 1 << 8
+LEVEL_UP = 1 << 9
+
+LEVEL_UP_CHOICES = ("hp", "str", "def")
+
+
+def encode_action(action):
+    """ Pack an action dict into bytes: a u16 key mask, then the payloads
+
+    """
+
+    mask = 0
+    payload = []
+
+    for bit, key in enumerate(FLAG_KEYS):
+        if action.get(key):
+            mask |= 1 << bit
+
+    if "move" in action:
+        mask |= MOVE
+        payload.append(struct.pack("<2b", *action["move"]))
+    if "inventory_index" in action:
+        mask |= INVENTORY_INDEX
+        payload.append(struct.pack("<h", action["inventory_index"]))
+    if "left_click" in action:
+        mask |= LEFT_CLICK
+        payload.append(struct.pack("<2H", *action["left_click"]))
+    if "right_click" in action:
+        mask |= RIGHT_CLICK
+        payload.append(struct.pack("<2H", *action["right_click"]))
+    if "level_up" in action:
+        mask |= LEVEL_UP
+        payload.append(
+            struct.pack("<B", LEVEL_UP_CHOICES.index(action["level_up"])))
+
+    return struct.pack("<H", mask) + b"".join(payload)
+
+
+def decode_actions(data, offset=0):
+    """ Unpack every action stored from an offset onwards
+
+    """
+
+    actions = []
+
+    while offset < len(data):
+        (mask, ) = struct.unpack_from("<H", data, offset)
+        offset += 2
+
+        action = {}
+
+        for bit, key in enumerate(FLAG_KEYS):
+            if mask & (1 << bit):
+                action[key] = True
+
+        if mask & MOVE:
+            action["move"] = struct.unpack_from("<2b", data, offset)
+            offset += 2
+        if mask & INVENTORY_INDEX:
+            (action["inventory_index"], ) = struct.unpack_from(
+                "<h", data, offset)
+            offset += 2
+        if mask & LEFT_CLICK:
+            action["left_click"] = struct.unpack_from("<2H", data, offset)
+            offset += 4
+        if mask & RIGHT_CLICK:
+            action["right_click"] = struct.unpack_from("<2H", data, offset)
+            offset += 4
+        if mask & LEVEL_UP:
+            action["level_up"] = LEVEL_UP_CHOICES[data[offset]]
+            offset += 1
+
+        actions.append(action)
+
+    return actions
+
+
+class ActionRecorder:
+    """ Writes the actions of a session to a recording, as they are taken
+
+    """
+
+    def __init__(self, path, simulation):
+        snapshot = snapshot_game(simulation.player, simulation.entities,
+                                 simulation.game_map, simulation.message_log,
+                                 simulation.game_state)
+        start = encode_snapshot(snapshot)
+
+        self.data_file = open(path, "wb")
+        self.data_file.write(MAGIC)
+        self.data_file.write(
+            struct.pack("<HQI", VERSION, simulation.seed, len(start)))
+        self.data_file.write(start)
+
+    def record(self, action, mouse_action=None):
+        """ Append an action (merged with its mouse action, as in `step`)
+
+        """
+
+        if mouse_action:
+            action = {**action, **mouse_action}
+
+        action = {
+            key: value
+            for key, value in action.items() if key not in FRONT_END_KEYS
+        }
+
+        # Most frames have no input, and an empty action changes nothing
+        if action:
+            self.data_file.write(encode_action(action))
+
+    def close(self):
+        """ Finish the recording
+
+        """
+
+        self.data_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Recording:
+    """ A loaded recording: its seed, starting save and actions
+
+    """
+
+    def __init__(self, seed, start, actions):
+        self.seed = seed
+        self.start = start
+        self.actions = actions
+
+    @classmethod
+    def load(cls, path):
+        """ Read a recording file
+
+        """
+
+        with open(path, "rb") as data_file:
+            data = data_file.read()
+
+        if data[:len(MAGIC)] != MAGIC:
+            raise SaveFormatError("Not a recording")
+
+        offset = len(MAGIC)
+        (version, seed, start_size) = struct.unpack_from("<HQI", data, offset)
+
+        if version != VERSION:
+            raise SaveFormatError(f"Unsupported recording version {version}")
+
+        offset += struct.calcsize("<HQI")
+        start = data[offset:offset + start_size]
+        actions = decode_actions(data, offset + start_size)
+
+        return cls(seed, start, actions)
+
+    def new_simulation(self, constants):
+        """ A simulation in the state the session started from
+
+        """
+
+        player, entities, game_map, message_log, _ = decode_game(self.start)
+
+        return Simulation(player,
+                          entities,
+                          game_map,
+                          message_log,
+                          constants,
+                          seed=self.seed)
+
+
+def replay(recording, constants, render=False):
+    """ Play a recording back, returning the simulation it ends with
+
+    With `render`, every frame is also drawn (off screen), as the game would.
+
+    """
+
+    simulation = recording.new_simulation(constants)
+
+    if not render:
+        simulation.run(recording.actions)
+        return simulation
+
+    console = tcod.console.Console(constants["screen_width"],
+                                   constants["screen_height"])
+    panel = tcod.console.Console(constants["screen_width"],
+                                 constants["panel_height"])
+    mouse = tcod.Mouse()
+
+    for action in recording.actions:
+        fov_recompute = simulation.update_fov()
+
+        render_all(console, panel, simulation.entities, simulation.player,
+                   simulation.game_map, simulation.fov_map, fov_recompute,
+                   simulation.message_log, constants["screen_width"],
+                   constants["screen_height"], constants["bar_width"],
+                   constants["panel_height"], constants["panel_y"], mouse,
+                   constants["colors"], simulation.game_state)
+
+        if any(isinstance(event, Exit) for event in simulation.step(action)):
+            break
+
+    return simulation
+
+
+def main(argv=None):
+    """ Command line entry point: time the replay of a recording
+
+    """
+
+    parser = argparse.ArgumentParser(
+        prog="python replay.py",
+        description="Replay a recorded session as fast as possible.")
+    parser.add_argument("recording")
+    parser.add_argument("--render",
+                        action="store_true",
+                        help="draw every frame, as the game would")
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    recording = Recording.load(args.recording)
+    constants = get_constants()
+
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        simulation = replay(recording, constants, args.render)
+        elapsed = time.perf_counter() - start
+
+        print(f"{len(recording.actions)} actions in {elapsed:.3f} s "
+              f"(turn {simulation.turn}, "
+              f"dungeon level {simulation.game_map.dungeon_level}, "
+              f"{simulation.game_state.name})")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,505 @@
+""" Simulation:
+
+- headless game engine (no window, no rendering)
+- advance turns from a stream of actions
+- report the result events of every turn
+
+"""
+
+import time
+
+import tcod
+
+from death_functions import kill_monster, kill_player
+from fov_functions import recompute_fov
+from game_events import (Dead, Exit, ItemAdded, ItemConsumed, ItemDropped,
+                         MessageEvent, NewFloor, Targeting, TargetingCancelled)
+from game_messages import Message
+from game_states import GameStates
+from map_objects.game_map import generate_floor
+from monster_schedule import MonsterSchedule
+from phase_timer import NULL_TIMER
+from random_streams import RandomStreams, new_seed
+
+
+class Simulation:
+    """ Game state, advanced one action at a time
+
+    Actions are the dicts produced by `handle_keys` and `handle_mouse`. Each
+    step returns the events of the turn (see game_events), the ones the
+    components produce plus `NewFloor` when the player takes the stairs and
+    `Exit` when the player asks to leave the game.
+
+    Every random choice comes from streams seeded by `seed`, so the same
+    game state, seed and actions always play out the same way.
+
+    With a `floor_prefetcher`, the next floor is built in the background
+    while the current one is played. Floors are built from a seed drawn in
+    advance, so they are the same with or without it.
+
+    With a `timer` (a PhaseTimer), the FOV, the player's action and the
+    enemy turn (in total and per AI type) are timed.
+
+    """
+
+    def __init__(self,
+                 player,
+                 entities,
+                 game_map,
+                 message_log,
+                 constants,
+                 floor_prefetcher=None,
+                 seed=None,
+                 timer=None):
+        self.player = player
+        self.entities = entities
+        self.game_map = game_map
+        self.message_log = message_log
+        self.constants = constants
+
+        self.timer = NULL_TIMER if timer is None else timer
+
+        self.seed = new_seed() if seed is None else seed
+        self.random = RandomStreams(self.seed)
+
+        self.fov_recompute = True
+
+        # Only awake monsters take turns
+        self.active_monsters = MonsterSchedule(
+            constants["monster_dormancy_turns"],
+            constants["monsters_follow_noise"])
+
+        self.game_state = GameStates.PLAYERS_TURN
+        self.previous_game_state = self.game_state
+
+        self.targeting_item = None
+
+        # Completed game turns (one player action and the monsters' replies)
+        self.turn = 0
+
+        self.floor_prefetcher = floor_prefetcher
+        self.prepare_next_floor()
+
+    @property
+    def fov_map(self):
+        """ The field of view map, kept by the current floor
+
+        """
+
+        return self.game_map.fov_map
+
+    def prepare_next_floor(self):
+        """ Pick the seed of the floor below, and start building it
+
+        """
+
+        self.next_floor_seed = self.random.floors.getrandbits(32)
+
+        if self.floor_prefetcher:
+            self.floor_prefetcher.request(self.game_map.dungeon_level + 1,
+                                          self.constants,
+                                          self.next_floor_seed)
+
+    def take_next_floor(self):
+        """ The floor below, built ahead of time if possible
+
+        """
+
+        dungeon_level = self.game_map.dungeon_level + 1
+
+        if self.floor_prefetcher:
+            return self.floor_prefetcher.take(dungeon_level, self.constants,
+                                              self.next_floor_seed)
+
+        return generate_floor(dungeon_level, self.constants,
+                              self.next_floor_seed)
+
+    def update_fov(self):
+        """ Recompute the field of view if the player moved
+
+        Returns whether it was recomputed.
+
+        """
+
+        if not self.fov_recompute:
+            return False
+
+        with self.timer.phase("fov"):
+            recompute_fov(
+                self.fov_map,
+                self.player.x_pos,
+                self.player.y_pos,
+                self.constants["fov_radius"],
+                self.constants["fov_light_walls"],
+                self.constants["fov_algorithm"],
+                self.game_map.fov_cache,
+            )
+            self.fov_recompute = False
+
+            # Dormant monsters cannot move, so they can only come into view
+            # when the field of view changes
+            self.active_monsters.wake_visible(self.fov_map,
+                                              self.game_map.entity_store)
+
+        return True
+
+    def run(self, actions):
+        """ Feed a stream of actions, returning all of their result events
+
+        Stops early if an action asks to exit the game.
+
+        """
+
+        results = []
+
+        for action in actions:
+            step_results = self.step(action)
+            results.extend(step_results)
+
+            if any(isinstance(event, Exit) for event in step_results):
+                break
+
+        return results
+
+    def step(self, action, mouse_action=None):
+        """ Advance the game by one action, returning its result events
+
+        """
+
+        if mouse_action:
+            action = {**action, **mouse_action}
+
+        self.update_fov()
+
+        with self.timer.phase("player_action"):
+            player_turn_results = self.take_player_action(action)
+
+            if any(isinstance(event, Exit) for event in player_turn_results):
+                return player_turn_results
+
+            self.resolve_player_turn(player_turn_results)
+
+        with self.timer.phase("enemy_turn"):
+            enemy_turn_results = self.take_enemy_turn()
+
+        return player_turn_results + enemy_turn_results
+
+    def take_player_action(self, action):
+        """ Carry out the player's action, returning the results to resolve
+
+        """
+
+        player = self.player
+        entities = self.entities
+        game_map = self.game_map
+        message_log = self.message_log
+
+        move = action.get("move")
+        pickup = action.get("pickup")
+        show_inventory = action.get("show_inventory")
+        drop_inventory = action.get("drop_inventory")
+        inventory_index = action.get("inventory_index")
+        take_stairs = action.get('take_stairs')
+        level_up = action.get('level_up')
+        exit_game = action.get("exit")
+
+        left_click = action.get("left_click")
+        right_click = action.get("right_click")
+
+        player_turn_results = []
+
+        if move and self.game_state == GameStates.PLAYERS_TURN:
+            d_x, d_y = move
+            destination_x = player.x_pos + d_x
+            destination_y = player.y_pos + d_y
+
+            if not game_map.is_blocked(destination_x, destination_y):
+                target = game_map.get_blocking_entity_at(
+                    destination_x, destination_y)
+
+                if target:
+                    attack_results = player.fighter.attack(target)
+                    player_turn_results.extend(attack_results)
+                    self.make_noise(player)
+                else:
+                    player.move(d_x, d_y)
+                    self.fov_recompute = True
+
+                self.game_state = GameStates.ENEMY_TURN
+
+        elif pickup and self.game_state == GameStates.PLAYERS_TURN:
+            for entity in game_map.get_entities_at(player.x_pos,
+                                                   player.y_pos):
+                if entity.item:
+                    pickup_results = player.inventory.add_item(entity)
+                    player_turn_results.extend(pickup_results)
+
+                    break
+            else:
+                message_log.add_message(
+                    Message("There is nothing here to pick up.", tcod.yellow))
+
+        if show_inventory:
+            self.previous_game_state = self.game_state
+            self.game_state = GameStates.SHOW_INVENTORY
+
+        if drop_inventory:
+            self.previous_game_state = self.game_state
+            self.game_state = GameStates.DROP_INVENTORY
+
+        if (inventory_index is not None
+                and self.previous_game_state != GameStates.PLAYER_DEAD
+                and inventory_index < len(player.inventory.items)):
+            item = player.inventory.items[inventory_index]
+
+            if self.game_state == GameStates.SHOW_INVENTORY:
+                player_turn_results.extend(
+                    player.inventory.use(
+                        item,
+                        entities=entities,
+                        fov_map=self.fov_map,
+                        game_map=game_map))
+            elif self.game_state == GameStates.DROP_INVENTORY:
+                player_turn_results.extend(player.inventory.drop_item(item))
+
+        if take_stairs and self.game_state == GameStates.PLAYERS_TURN:
+            for entity in game_map.get_entities_at(player.x_pos,
+                                                   player.y_pos):
+                if entity.stairs:
+                    self.entities = game_map.next_floor(
+                        player, message_log, self.take_next_floor())
+                    self.fov_recompute = True
+                    self.active_monsters = MonsterSchedule(
+                        self.constants["monster_dormancy_turns"],
+                        self.constants["monsters_follow_noise"])
+                    self.prepare_next_floor()
+                    player_turn_results.append(
+                        NewFloor(game_map.dungeon_level))
+                    break
+            else:
+                message_log.add_message(
+                    Message('There are no stairs here.', tcod.yellow))
+
+        if level_up:
+            if level_up == 'hp':
+                player.fighter.max_hp += 20
+                player.fighter.hp += 20
+            elif level_up == 'str':
+                player.fighter.power += 1
+            elif level_up == 'def':
+                player.fighter.defense += 1
+
+            self.game_state = self.previous_game_state
+
+        if self.game_state == GameStates.TARGETING:
+            if left_click:
+                target_x_pos, target_y_pos = left_click
+
+                item_use_results = player.inventory.use(
+                    self.targeting_item,
+                    entities=entities,
+                    fov_map=self.fov_map,
+                    game_map=game_map,
+                    target_x_pos=target_x_pos,
+                    target_y_pos=target_y_pos,
+                )
+                player_turn_results.extend(item_use_results)
+            elif right_click:
+                player_turn_results.append(TargetingCancelled())
+
+        if exit_game:
+            if self.game_state in (GameStates.SHOW_INVENTORY,
+                                   GameStates.DROP_INVENTORY):
+                self.game_state = self.previous_game_state
+            elif self.game_state == GameStates.TARGETING:
+                player_turn_results.append(TargetingCancelled())
+            else:
+                return [Exit()]
+
+        return player_turn_results
+
+    def resolve_events(self, events):
+        """ Apply events to the game state, through the dispatch table
+
+        """
+
+        handlers = self.EVENT_HANDLERS
+
+        for event in events:
+            handler = handlers.get(type(event))
+
+            if handler:
+                handler(self, event)
+
+    def resolve_player_turn(self, player_turn_results):
+        """ Apply the results of the player's action to the game state
+
+        """
+
+        self.resolve_events(player_turn_results)
+
+    def on_message(self, event):
+        """ Log a message
+
+        """
+
+        self.message_log.add_message(event.message)
+
+    def on_dead(self, event):
+        """ Kill an entity, and reward the player for it
+
+        """
+
+        if event.entity == self.player:
+            message, self.game_state = kill_player(event.entity)
+        else:
+            message = kill_monster(event.entity)
+
+        self.message_log.add_message(message)
+
+        if event.xp:
+            self.gain_xp(event.xp)
+
+    def gain_xp(self, xp):
+        """ Give the player experience, leveling up when there is enough
+
+        """
+
+        player = self.player
+        message_log = self.message_log
+
+        leveled_up = player.level.add_xp(xp)
+        message_log.add_message(Message(f'You gain {xp} experience points'))
+
+        if leveled_up:
+            message_log.add_message(
+                Message(
+                    f'Your battle skills grow stronger! You reached level {player.level.current_level}!',
+                    tcod.yellow))
+            self.previous_game_state = self.game_state
+            self.game_state = GameStates.LEVEL_UP
+
+    def on_item_added(self, event):
+        """ Take a picked up item off the floor
+
+        """
+
+        self.entities.remove(event.item)
+        self.game_map.remove_entity(event.item)
+        self.game_state = GameStates.ENEMY_TURN
+
+    def on_item_consumed(self, event):
+        """ Using an item takes a turn, and makes noise
+
+        """
+
+        self.game_state = GameStates.ENEMY_TURN
+        self.make_noise(self.player)
+
+    def on_item_dropped(self, event):
+        """ Put a dropped item on the floor
+
+        """
+
+        self.entities.append(event.item)
+        self.game_map.add_entity(event.item)
+        self.game_state = GameStates.ENEMY_TURN
+
+    def on_targeting(self, event):
+        """ Ask the player to pick a target for an item
+
+        """
+
+        self.previous_game_state = GameStates.PLAYERS_TURN
+        self.game_state = GameStates.TARGETING
+
+        self.targeting_item = event.item
+
+        self.message_log.add_message(
+            self.targeting_item.item.targeting_message)
+
+    def on_targeting_cancelled(self, event):
+        """ Go back to what the player was doing before
+
+        """
+
+        self.game_state = self.previous_game_state
+
+        self.message_log.add_message(Message("Targeting cancelled"))
+
+    # Event type -> handler. NewFloor and Exit are left to the front-end.
+    EVENT_HANDLERS = {
+        MessageEvent: on_message,
+        Dead: on_dead,
+        ItemAdded: on_item_added,
+        ItemConsumed: on_item_consumed,
+        ItemDropped: on_item_dropped,
+        Targeting: on_targeting,
+        TargetingCancelled: on_targeting_cancelled,
+    }
+
+    def make_noise(self, entity):
+        """ Wake the monsters that can hear an entity fight or cast
+
+        """
+
+        self.active_monsters.make_noise(self.game_map.entity_store,
+                                        entity.x_pos, entity.y_pos,
+                                        self.constants["noise_radius"])
+
+    def take_enemy_turn(self):
+        """ Let every awake monster act, returning their result events
+
+        """
+
+        enemy_turn_results = []
+
+        if self.game_state != GameStates.ENEMY_TURN:
+            return enemy_turn_results
+
+        self.turn += 1
+
+        player = self.player
+        handlers = self.EVENT_HANDLERS
+
+        # AI type name -> time its monsters took this turn, in nanoseconds
+        # (only when timing)
+        ai_durations = {} if self.timer.enabled else None
+
+        for entity in self.active_monsters:
+            if entity.ai:
+                if ai_durations is not None:
+                    ai_type = type(entity.ai).__name__
+                    start = time.perf_counter_ns()
+
+                results = entity.ai.take_turn(player, self.fov_map,
+                                              self.game_map, self.entities,
+                                              self.random.monsters)
+
+                if ai_durations is not None:
+                    ai_durations[ai_type] = (ai_durations.get(ai_type, 0) +
+                                             time.perf_counter_ns() - start)
+
+                enemy_turn_results.extend(results)
+
+                for event in results:
+                    handler = handlers.get(type(event))
+
+                    if handler:
+                        handler(self, event)
+
+                    if self.game_state == GameStates.PLAYER_DEAD:
+                        break
+
+                if self.game_state == GameStates.PLAYER_DEAD:
+                    break
+        else:
+            self.game_state = GameStates.PLAYERS_TURN
+
+        if ai_durations:
+            for ai_type, duration in ai_durations.items():
+                self.timer.add(f"enemy_turn.{ai_type}", duration)
+
+        self.active_monsters.end_turn(self.fov_map)
+
+        return enemy_turn_results